@@ -14,6 +14,8 @@
 """Package merakygen."""
 import re
 import datetime
+import functools
+import os
 
 __version__ = '0.2.2'
 __author__ = 'Ross Jacobs'
@@ -26,9 +28,12 @@ __copyright__ = 'Copyright 2019-' + str(datetime.datetime.now().year) + \
 __changelog_url__ = __project_url__ + '/blob/master/CHANGELOG.md'
 
 
+@functools.lru_cache()
 def format_changelog():
     """Get formatted text from the changelog that looks better in a cli."""
-    with open('../CHANGELOG.md') as file_obj:
+    changelog_path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', 'CHANGELOG.md')
+    with open(changelog_path, encoding='utf-8') as file_obj:
         changelog = file_obj.read()
     # Delete headings and indent bullet points.
     changelog = changelog.replace('###', ' ').replace('\n*', '\n\t*')
@@ -38,4 +43,9 @@ def format_changelog():
     return '\n'.join(releases)
 
 
-__changelog__ = format_changelog()
+def __getattr__(name):
+    """Only read the changelog when __changelog__ is used."""
+    if name == '__changelog__':
+        return format_changelog()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(
+        __name__, name))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""On-disk caches shared by runs of merakygen.
+
+Everything lives under $MERAKYGEN_CACHE_DIR, which defaults to
+$XDG_CACHE_HOME/merakygen (~/.cache/merakygen).
+"""
+import contextlib
+import hashlib
+import os
+import secrets
+import time
+
+# Flags of a new temp file, like tempfile.mkstemp uses.
+TEMP_FILE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | \
+    getattr(os, 'O_BINARY', 0)
+
+
+def get_cache_dir(name):
+    """Get (and make) the folder of one cache, like 'apidocs'."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    cache_root = os.environ.get('MERAKYGEN_CACHE_DIR') or \
+        os.path.join(cache_home, 'merakygen')
+    cache_dir = os.path.join(cache_root, name)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def get_hash(data):
+    """Get the sha256 hex digest of bytes or a string."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_temp_file(folder):
+    """Make a temp file in folder and get its file descriptor and name.
+
+    Unlike mkstemp, which makes files only the owner can read, the file gets
+    the usual permissions (0o666 less the umask), as it replaces an output.
+    """
+    while True:
+        temp_filename = os.path.join(
+            folder, 'tmp' + secrets.token_hex(8) + '.tmp')
+        try:
+            return os.open(temp_filename, TEMP_FILE_FLAGS, 0o666), \
+                temp_filename
+        except FileExistsError:
+            continue
+
+
+def write_atomic(filename, data):
+    """Write bytes or a string so readers never see a partial file.
+
+    The data goes to a temp file in the same folder that then replaces
+    filename, so concurrent runs can share a cache.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    file_desc, temp_filename = make_temp_file(
+        os.path.dirname(filename) or '.')
+    try:
+        with os.fdopen(file_desc, 'wb') as file_obj:
+            file_obj.write(data)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.remove(temp_filename)
+        raise
+
+
+def evict_files(cache_dir, max_age, max_bytes):
+    """Delete the files of a cache that are older than max_age seconds, and
+    then the oldest ones until the rest fit in max_bytes."""
+    cache_files = []
+    for entry in os.scandir(cache_dir):
+        try:
+            stat = entry.stat()
+        except OSError:  # Deleted by another run
+            continue
+        cache_files.append((stat.st_mtime, stat.st_size, entry.path))
+    cache_files.sort(reverse=True)  # Newest first
+    total_bytes = 0
+    now = time.time()
+    for mtime, size, filename in cache_files:
+        total_bytes += size
+        if now - mtime > max_age or total_bytes > max_bytes:
+            with contextlib.suppress(OSError):
+                os.remove(filename)
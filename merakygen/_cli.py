@@ -18,6 +18,8 @@
 USAGE:
     merakygen (--key <apikey>) [--language <name>] [--targetapi <api>]
                   [--classy] [--lint] [--textwrap] [--sample-resp]
+                  [--async] [--no-ir-cache] [--single-file]
+                  [--timings] [--profile] [--memory]
                   [-h | --help] [-v | --version]
 
 DESCRIPTION:
@@ -29,14 +31,29 @@ OPTIONS:
   --key <apikey>        Your API key. You can find it by going to your profile.
   --language <name>     Create a script in language. Valid options are
                         python, ruby, bash, and powershell. If no language is
-                        specified, python will be used.
+                        specified, python will be used. Use a comma-separated
+                        list like python,ruby or all to generate several
+                        languages in parallel.
                         For ruby linting, ruby/gem will need to be installed.
   --targetapi <api>     The API that is being targeted. Default is Meraki.
+  -a, --async           Also generate an asyncio module of the same functions
+                        as coroutines on httpx (python only).
   -c, --classy          Use classes instead of a function list.
   -l, --lint            Call Pylint. If not 10.00/10, print error text.
   -r, --sample-resp     Add the sample response to function documentation.
+  --single-file         Write the powershell module as one .psm1 instead of
+                        one file per function, which imports much faster.
+  --no-ir-cache         Parse the apidocs again instead of loading the parsed
+                        API calls cached by an earlier run.
   -t, --textwrap        Wrap text according to language. Python(79), Ruby(120)
                         Default is to wrap.
+  --timings             Save the wall and CPU time of every stage (fetch,
+                        modify_api_calls, emit, format, lint, write...) as
+                        json to merakygen_timings.json.
+  --profile             Also profile every stage with cProfile and dump the
+                        stats to merakygen_profile/<stage>.pstats.
+  --memory              Also save the peak and retained memory of every
+                        stage and language, and the lines that allocated it.
   -h, --help            Print this help message.
   -v, --version         Print version and exit.
 
@@ -50,9 +67,8 @@ import re
 
 import docopt
 
-from requests import __version__ as requests_version
-from yapf import __version__ as yapf_version
 from merakygen import __version__ as apigen_version
+from merakygen.create_method import LANGUAGES
 
 
 def get_bash_version():
@@ -104,6 +120,10 @@ def show_cli():
     """Show the docopt cli"""
     args = docopt.docopt(__doc__)
     if args['--version']:
+        # Only import these to show their versions as they are slow to load.
+        # pylint: disable=import-outside-toplevel
+        from requests import __version__ as requests_version
+        from yapf import __version__ as yapf_version
         python_ver = sys.version.replace('\n', '')
         print('Meraki-APIgen', apigen_version, '\n\nPython', python_ver)
         print('\trequests', requests_version, '\n\tyapf', yapf_version)
@@ -116,11 +136,24 @@ def show_cli():
     # Python is default
     if not args['--language']:
         args['--language'] = 'python'
-    if args['--language'] not in ['bash', 'python', 'ruby', 'powershell']:
-        raise ValueError("Only valid languages are python, ruby, "
-                         "bash, and powershell.\n" + __doc__)
+    languages = get_languages(args['--language'])
 
     # These are all of the user-selected options.
     required_args = ['--key', '--language']
     options = [arg for arg in args if args[arg] and arg not in required_args]
-    return args['--key'], args['--language'], options
+    return args['--key'], languages, options
+
+
+def get_languages(language_arg):
+    """Get the list of languages from 'python', 'python,ruby' or 'all'."""
+    if language_arg == 'all':
+        return list(LANGUAGES)
+    languages = []
+    for language in language_arg.split(','):
+        language = language.strip()
+        if language not in LANGUAGES:
+            raise ValueError("Only valid languages are python, ruby, "
+                             "bash, and powershell.\n" + __doc__)
+        if language not in languages:
+            languages.append(language)
+    return languages
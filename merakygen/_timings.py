@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Record the wall and CPU time of each stage of a run.
+
+With --timings, every `with stage(name):` block adds its time to the stage,
+and main saves them all to TIMINGS_FILE. With --profile, each stage is also
+run under its own cProfile.Profile, which is dumped to PROFILE_DIR as
+<stage>.pstats. With --memory, tracemalloc also records the peak and
+retained memory of each stage and the lines that allocated what it retained.
+Stages should not be nested. Without any of these options, stage() does
+nothing.
+"""
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import merakygen
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TIMINGS_FILE = 'merakygen_timings.json'
+PROFILE_DIR = 'merakygen_profile'
+# Stages recorded in this process: name => {'wall_s', 'cpu_s', 'count'}
+STAGES = {}
+PROFILERS = {}
+# Stage name => {'file:line': bytes retained by its first block}
+SITES = {}
+SETTINGS = {'timings': False, 'profile': False, 'memory': False}
+MEMORY_TOP_SITES = 5
+
+
+def configure(options):
+    """Start recording stages (again) if --timings, --profile or --memory."""
+    SETTINGS['profile'] = '--profile' in options
+    SETTINGS['memory'] = '--memory' in options
+    SETTINGS['timings'] = '--timings' in options or SETTINGS['profile'] or \
+        SETTINGS['memory']
+    STAGES.clear()
+    PROFILERS.clear()
+    SITES.clear()
+    # Memory is traced from here, so a language's own process only counts
+    # what it allocates and not the API calls it was sent.
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    if SETTINGS['memory']:
+        tracemalloc.start()
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Add the wall and CPU time (and memory) of the block to stage name."""
+    if not SETTINGS['timings']:
+        yield
+        return
+    profiler = None
+    if SETTINGS['profile']:
+        profiler = PROFILERS.setdefault(name, cProfile.Profile())
+        profiler.enable()
+    start_snapshot = None
+    if SETTINGS['memory']:
+        # Snapshots are slow, so only the first block of a stage (like the
+        # first function of powershell.emit) gets its allocation sites.
+        if name not in STAGES:
+            start_snapshot = tracemalloc.take_snapshot()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+            tracemalloc.reset_peak()
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.disable()
+        timing = STAGES.setdefault(name, {'wall_s': 0, 'cpu_s': 0,
+                                          'count': 0})
+        timing['wall_s'] += wall - start_wall
+        timing['cpu_s'] += cpu - start_cpu
+        timing['count'] += 1
+        if SETTINGS['memory']:
+            add_memory(name, timing, start_snapshot, start_memory)
+
+
+def add_memory(name, timing, start_snapshot, start_memory):
+    """Add the memory used by a block of a stage to its timing.
+
+    peak_kib is the most memory traced in the process during the stage and
+    retained_kib is how much more is traced after the stage than before.
+    Without start_snapshot, the allocation sites are not compared.
+    """
+    memory, peak = tracemalloc.get_traced_memory()
+    timing['peak_kib'] = max(timing.get('peak_kib', 0), peak / 1024)
+    timing['retained_kib'] = timing.get('retained_kib', 0) + \
+        (memory - start_memory) / 1024
+    if start_snapshot is None:
+        return
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)])
+    SITES[name] = {str(stat.traceback[0]): stat.size_diff
+                   for stat in snapshot.compare_to(start_snapshot, 'lineno')}
+
+
+def finish():
+    """Dump the profile of each stage and get the stages recorded so far."""
+    if PROFILERS:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+    for name, profiler in PROFILERS.items():
+        profile_file = os.path.join(PROFILE_DIR, name + '.pstats')
+        profiler.dump_stats(profile_file)
+        STAGES[name]['profile'] = profile_file
+    PROFILERS.clear()
+    for name, sites in SITES.items():
+        top_sites = sorted(sites.items(), key=lambda site: -site[1])
+        STAGES[name]['top_sites'] = [
+            {'site': site, 'retained_kib': size / 1024}
+            for site, size in top_sites[:MEMORY_TOP_SITES] if size > 0]
+    SITES.clear()
+    return dict(STAGES)
+
+
+def get_max_rss():
+    """Get the max resident memory in KiB of this process and its largest
+    child (like a language's process or pylint), if the OS reports it."""
+    if not resource:
+        return None
+    # ru_maxrss is in bytes on macOS and in KiB everywhere else.
+    scale = 1024 if sys.platform == 'darwin' else 1
+    return {
+        'merakygen': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        'largest_child':
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+def get_language_memory(stages, languages):
+    """Get the peak and retained memory of each language's stages."""
+    language_memory = {}
+    for language in languages:
+        language_stages = [timing for name, timing in stages.items()
+                           if name.startswith(language + '.')
+                           and 'peak_kib' in timing]
+        if language_stages:
+            language_memory[language] = {
+                'peak_kib': max(timing['peak_kib']
+                                for timing in language_stages),
+                'retained_kib': sum(timing['retained_kib']
+                                    for timing in language_stages),
+            }
+    return language_memory
+
+
+def save_report(stages, language_times, options):
+    """Save the stages of a run as json to TIMINGS_FILE."""
+    report = {
+        'version': merakygen.__version__,
+        'options': sorted(options),
+        'languages': language_times,
+        'stages': stages,
+    }
+    if '--memory' in options:
+        report['memory'] = get_language_memory(stages, language_times)
+        report['max_rss_kib'] = get_max_rss()
+        print('\nPeak traced memory per language:')
+        for language, memory in report['memory'].items():
+            print('\t{:<11} {:.0f} KiB'.format(language, memory['peak_kib']))
+    with open(TIMINGS_FILE, 'w', encoding='utf-8') as file_obj:
+        json.dump(report, file_obj, indent=2, sort_keys=True)
+    print('Stage timings saved to ' + TIMINGS_FILE)
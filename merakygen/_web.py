@@ -19,38 +19,111 @@ import time
 
 import requests
 
+import merakygen._cache as cache
 
-def fetch_meraki_apidocs_json():
+APIDOCS_URL = 'https://dashboard.meraki.com/api_docs'
+STATIC_API_JSON = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'static', 'api.json')
+# (connect, read) timeouts in seconds so a dead network can't hang a run.
+TIMEOUT = (5, 30)
+# A cached spec younger than this is used without asking the server.
+MAX_AGE = 86400
+CHUNK_SIZE = 65536
+JSON_START = b'window.allApisJson = '
+JSON_END = b';\n  </script>'
+
+
+def fetch_meraki_apidocs_json(url=APIDOCS_URL, max_age=MAX_AGE):
     """Get all Meraki API calls from the official docs.
 
     * apidocs json is shipped with projcet at merakygen/static/api.json
     * This will be used if there is no network connection, but
       may be out-of-date.
-    * If this program is run multiple times, try to cache it to
-      save on network requests and speed.
+    * Every spec that is fetched is saved in the apidocs cache under its
+      sha256. Once the cached spec is older than max_age, the docs are
+      asked for it with If-None-Match/If-Modified-Since, so an unchanged
+      spec costs one small 304 round trip.
     """
+    cache_dir = cache.get_cache_dir('apidocs')
+    meta_file = os.path.join(cache_dir, cache.get_hash(url) + '.meta.json')
+    meta = load_cache_meta(meta_file)
+    spec_file = os.path.join(cache_dir, meta.get('sha256', '') + '.json')
+    has_cache = bool(meta) and os.path.isfile(spec_file)
+    if has_cache and time.time() - meta['checked_at'] < max_age:
+        return get_json_str_from_file(spec_file)
+
+    headers = {}
+    if has_cache and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if has_cache and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
     try:
-        # If a local copy has been created in the last 24 hours, use it.
-        if os.path.exists('api.json') and \
-                time.time() - os.stat('api.json').st_mtime > 86400:
-            api_docs = get_json_str_from_file('api.json')
-        else:
-            # Get the json by splitting the pagetext at json beginning and end.
-            meraki_apidocs = 'https://dashboard.meraki.com/api_docs'
-            pagetext = requests.get(meraki_apidocs).text
-            lower_split = pagetext.split("window.allApisJson = ")[1]
-            all_api_docs_str = lower_split.split(";\n  </script>")[0]
-            # Write the json so a cached version is now available.
-            with open('api.json', 'w') as file_obj:
-                file_obj.write(all_api_docs_str)
-            api_docs = json.loads(all_api_docs_str)
-    except requests.exceptions.ConnectionError:
-        api_docs = get_json_str_from_file('../static/api.json')
+        with requests.get(url, headers=headers, timeout=TIMEOUT,
+                          stream=True) as response:
+            if response.status_code == 304 and has_cache:
+                api_docs = get_json_str_from_file(spec_file)
+            else:
+                response.raise_for_status()
+                api_docs_str = extract_apidocs_json(
+                    response.iter_content(CHUNK_SIZE))
+                api_docs = json.loads(api_docs_str)
+                meta = {
+                    'url': url,
+                    'sha256': cache.get_hash(api_docs_str),
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'size': len(api_docs_str),
+                }
+                spec_file = os.path.join(cache_dir, meta['sha256'] + '.json')
+                if not os.path.isfile(spec_file):
+                    cache.write_atomic(spec_file, api_docs_str)
+    except (requests.exceptions.RequestException, ValueError) as error:
+        print('WARNING: Could not fetch the apidocs: ' + str(error))
+        if has_cache:
+            print('Using the last fetched apidocs from ' + spec_file)
+            return get_json_str_from_file(spec_file)
+        print('Using the shipped static/api.json, which may be out of date.')
+        return get_json_str_from_file(STATIC_API_JSON)
 
+    meta['checked_at'] = time.time()
+    cache.write_atomic(meta_file, json.dumps(meta))
     return api_docs
 
 
+def extract_apidocs_json(chunks):
+    """Get the text of window.allApisJson from chunks of the apidocs page.
+
+    Reading stops at the end of the json, so the rest of the page is not
+    downloaded.
+    """
+    pagetext = bytearray()
+    json_start = -1
+    for chunk in chunks:
+        # Markers may straddle chunks, so search from a little before them.
+        search_start = max(len(pagetext) - len(JSON_START), 0)
+        pagetext += chunk
+        if json_start < 0:
+            json_start = pagetext.find(JSON_START, search_start)
+            if json_start < 0:
+                continue
+            json_start += len(JSON_START)
+            search_start = json_start
+        json_end = pagetext.find(JSON_END, max(search_start, json_start))
+        if json_end >= 0:
+            return pagetext[json_start:json_end].decode('utf-8')
+    raise ValueError('window.allApisJson is not in the apidocs page')
+
+
+def load_cache_meta(meta_file):
+    """Get the etag, sha256, etc. of the last fetched spec, if any."""
+    try:
+        return get_json_str_from_file(meta_file)
+    except (OSError, ValueError):
+        return {}
+
+
 def get_json_str_from_file(filename):
     """Open a file and get its JSON as a dict."""
-    with open(filename) as file_obj:
+    with open(filename, encoding='utf-8') as file_obj:
         return json.loads(file_obj.read())
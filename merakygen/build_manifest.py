@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Remember what was generated so reruns only redo what changed.
+
+Each output gets a manifest next to it that maps every endpoint
+(http_method + path) to a hash of its api.json entry, name, options and
+any other text its code is made from, like the powershell preamble.
+"""
+import filecmp
+import functools
+import glob
+import json
+import os
+import shutil
+
+import merakygen
+import merakygen._cache as cache
+
+# Options that change how merakygen runs, but not what it generates.
+IGNORED_OPTIONS = {'--memory', '--no-ir-cache', '--profile', '--timings'}
+
+
+@functools.lru_cache()
+def get_generator_hash():
+    """Hash the source of merakygen so that changes to it redo everything."""
+    sources = sorted(glob.glob(os.path.dirname(__file__) + '/*.py'))
+    source_text = ''
+    for source in sources:
+        with open(source, encoding='utf-8') as file_obj:
+            source_text += file_obj.read()
+    return cache.get_hash(source_text)
+
+
+def write_if_changed(filename, text):
+    """Write text to filename unless it already has that text.
+
+    Leaving unchanged files alone keeps their mtimes stable for build caches.
+    Returns whether the file was written.
+    """
+    if os.path.isfile(filename):
+        with open(filename, encoding='utf-8') as file_obj:
+            if file_obj.read() == text:
+                return False
+    cache.write_atomic(filename, text)
+    return True
+
+
+def copy_if_changed(filename, folder):
+    """Copy a file into folder unless an identical copy is already there."""
+    dest_filename = os.path.join(folder, os.path.basename(filename))
+    if os.path.isfile(dest_filename) and \
+            filecmp.cmp(filename, dest_filename, shallow=False):
+        return False
+    shutil.copy(filename, folder)
+    return True
+
+
+def get_manifest_filename(folder, output_name):
+    """Get the file that the manifest of an output is saved to."""
+    return os.path.join(folder, '.' + output_name + '.manifest')
+
+
+class BuildManifest:
+    """Endpoint hashes and rendered text from the last run for one output.
+
+    context is anything else (json-able) that the code of every endpoint
+    depends on, so that endpoints are redone when it changes.
+
+    Usage:
+        manifest = BuildManifest(folder, 'pacg_meraki.py', language, options)
+        text = manifest.get_text(api_call)
+        if text is None:  # New or changed since last run
+            text = render(api_call)
+        manifest.add(api_call, text)
+        ...
+        manifest.save()
+    """
+    def __init__(self, folder, output_name, language, options, context=''):
+        self.output_filename = os.path.join(folder, output_name)
+        self.filename = get_manifest_filename(folder, output_name)
+        options = sorted(set(options) - IGNORED_OPTIONS)
+        self.options_str = json.dumps([language, options, context,
+                                       merakygen.__version__,
+                                       get_generator_hash()])
+        self.old_entries = self.load()
+        self.entries = {}
+
+    def load(self):
+        """Load the entries saved by the last run, if there was one."""
+        try:
+            with open(self.filename, encoding='utf-8') as file_obj:
+                return json.load(file_obj)['entries']
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def get_hash(self, api_call):
+        """Hash the api.json entry, generated name, options and context."""
+        spec = api_call.get_spec()
+        spec['gen_name'] = api_call.gen_name
+        return cache.get_hash(json.dumps(spec, sort_keys=True) +
+                              self.options_str)
+
+    def is_unchanged(self, api_call):
+        """Whether the endpoint is the same as last run."""
+        entry = self.old_entries.get(api_call.key)
+        return bool(entry) and entry['hash'] == self.get_hash(api_call)
+
+    def get_text(self, api_call):
+        """Get the text rendered last run if the endpoint has not changed."""
+        if self.is_unchanged(api_call):
+            return self.old_entries[api_call.key]['text']
+        return None
+
+    def add(self, api_call, text, filename=''):
+        """Record the text (and file, if it has its own) for an endpoint."""
+        self.entries[api_call.key] = {
+            'hash': self.get_hash(api_call),
+            'text': text,
+            'file': filename,
+        }
+
+    def add_section(self, name, text):
+        """Record a non-endpoint section, like the shared runtime code."""
+        self.entries[name] = {'hash': cache.get_hash(text), 'text': text,
+                              'file': ''}
+
+    def get_changed(self):
+        """Get the keys of entries that are new or changed since last run."""
+        return [key for key, entry in self.entries.items()
+                if key not in self.old_entries or
+                self.old_entries[key]['hash'] != entry['hash']]
+
+    def get_removed(self):
+        """Get entries from last run whose endpoint no longer exists."""
+        return [entry for key, entry in self.old_entries.items()
+                if key not in self.entries]
+
+    def get_stale_files(self):
+        """Get files from last run that no endpoint is saved to anymore."""
+        files = {entry['file'] for entry in self.entries.values()}
+        return sorted({entry['file'] for entry in self.old_entries.values()
+                       if entry['file'] and entry['file'] not in files})
+
+    def has_changes(self):
+        """Whether anything was added, changed or removed since last run."""
+        return bool(self.get_changed() or self.get_removed())
+
+    def is_up_to_date(self):
+        """Whether the output from last run can be kept as it is."""
+        return not self.has_changes() and os.path.isfile(self.output_filename)
+
+    def save(self):
+        """Save the entries of this run for the next one."""
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+        text = json.dumps({'version': merakygen.__version__,
+                           'entries': self.entries}, sort_keys=True)
+        write_if_changed(self.filename, text)
@@ -13,37 +13,103 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Main file for Meraki-APIgen. Should only import from project files."""
+import concurrent.futures
+import sys
+import time
 
 import merakygen._cli as cli
-import merakygen._web as web
+import merakygen._timings as timings
 import merakygen.create_method as make_method
 
-import merakygen.make_python_script as mps
-import merakygen.make_ruby_script as mrs
-import merakygen.make_bash_script as mbs
-import merakygen.make_powershell_module as mpss
+# requests, yapf, pylint and the emitters are slow to import, so they are
+# only imported by the stage that needs them. --help never loads them.
+# pylint: disable=import-outside-toplevel
 
 
-def main():
-    """Main func.
-    Should take care of all functions that are shared across languages."""
-    api_key, language, options = cli.show_cli()
-    api_json = web.fetch_meraki_apidocs_json()
+def make_script(api_key, api_calls, language, options):
+    """Generate the script of one language from the modified API calls.
 
-    api_calls = make_method.modify_api_calls(api_json, options, language)
-    http_stats = make_method.get_http_stats(api_calls)
-    preamble = \
-        make_method.get_preamble(options, len(api_calls), http_stats, language)
+    Returns the wall time it took in seconds and the stages it recorded
+    (if --timings or --profile).
+    """
+    start_time = time.perf_counter()
+    timings.configure(options)  # Languages can be in their own processes.
+    api_calls = make_method.set_func_names(api_calls, language)
+    options = list(options)  # The preamble adds the language to options.
+    with timings.stage(language + '.get_http_stats'):
+        http_stats = make_method.get_http_stats(api_calls)
+    with timings.stage(language + '.preamble'):
+        preamble = make_method.get_preamble(options, len(api_calls),
+                                            http_stats, language)
 
     print('Generating a {' + language + '} script:')
     if language == 'python':
+        import merakygen.make_python_script as mps
         mps.make_python_script(api_key, api_calls, preamble, options)
     elif language == 'ruby':
+        import merakygen.make_ruby_script as mrs
         mrs.make_ruby_script(api_key, api_calls, preamble, options)
     elif language == 'bash':
-        mbs.make_bash_script(api_key, api_calls, preamble)
+        import merakygen.make_bash_script as mbs
+        mbs.make_bash_script(api_key, api_calls, preamble, options)
     elif language == 'powershell':
+        import merakygen.make_powershell_module as mpss
         mpss.make_powershell_script(api_key, api_calls, preamble, options)
+    return time.perf_counter() - start_time, timings.finish()
+
+
+def make_scripts(api_key, api_calls, languages, options):
+    """Generate every language, in parallel if there are several.
+
+    The API calls are only modified once and then sent to a process per
+    language. Returns {language: (wall time, stages) or the exception it
+    raised}.
+    """
+    if len(languages) == 1:
+        return {languages[0]: make_script(
+            api_key, api_calls, languages[0], options)}
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(len(languages)) as pool:
+        futures = {language: pool.submit(make_script, api_key, api_calls,
+                                         language, options)
+                   for language in languages}
+        for language, future in futures.items():
+            try:
+                results[language] = future.result()
+            except Exception as error:  # pylint: disable=broad-except
+                results[language] = error
+    return results
+
+
+def main():
+    """Main func.
+    Should take care of all functions that are shared across languages."""
+    api_key, languages, options = cli.show_cli()
+    timings.configure(options)
+    with timings.stage('fetch'):
+        import merakygen._web as web
+        api_json = web.fetch_meraki_apidocs_json()
+
+    with timings.stage('modify_api_calls'):
+        api_calls = make_method.get_api_calls(
+            api_json, languages[0], '--no-ir-cache' not in options)
+    stages = timings.finish()
+    results = make_scripts(api_key, api_calls, languages, options)
+
+    print('\nWall time per language:')
+    language_times = {}
+    for language, result in results.items():
+        if isinstance(result, Exception):
+            print('\t{:<11} failed: {!r}'.format(language, result))
+            language_times[language] = repr(result)
+        else:
+            print('\t{:<11} {:.2f}s'.format(language, result[0]))
+            language_times[language] = result[0]
+            stages.update(result[1])
+    if stages:
+        timings.save_report(stages, language_times, options)
+    if any(isinstance(result, Exception) for result in results.values()):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -95,11 +95,11 @@ API_PRIMITIVES = {
 
 def get_function_docstring(api_call, func_args):
     """Get the function docstring."""
-    api_call['func_desc'] = get_func_description(api_call['description'])
-    api_call['func_args'] = get_func_args(func_args)
-    api_call['func_link'] = get_api_link(api_call)
-    api_call['func_params'] = get_function_params(api_call)
-    api_call['func_return_type'] = get_func_type(api_call['sample_resp'])
+    api_call.func_desc = get_func_description(api_call.description)
+    api_call.func_args = get_func_args(func_args)
+    api_call.func_link = get_api_link(api_call)
+    api_call.func_params = get_function_params(api_call)
+    api_call.func_return_type = get_func_type(api_call.sample_resp)
     return api_call
 
 
@@ -127,10 +127,9 @@ def get_func_args(func_args):
 
 def get_function_params(api_call):
     """Get the function parameters from the API call."""
-    has_params = 'params' in api_call and api_call['params']
     func_params = {}
-    if has_params:
-        for index, param in enumerate(api_call['params']):
+    if api_call.params:
+        for param in api_call.params:
             param_description = remove_html(param['description'])
             has_nested_params = 'params' in param
             if has_nested_params:
@@ -154,7 +153,7 @@ def get_function_params(api_call):
 
 def get_api_link(api_call):
     """Get the API link from description."""
-    desc_first_sentence = api_call['description'].split('.')[0]
+    desc_first_sentence = api_call.description.split('.')[0]
     link_words = re.sub(r'[\'\(\)\-,]', '', desc_first_sentence)
     link_words = re.sub(r'[ ]+', ' ', link_words)  # Remove redundant spaces
     hypenated_link_words = re.sub(r'[ \/]', '-', link_words.lower())
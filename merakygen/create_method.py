@@ -16,18 +16,51 @@
 import re
 import datetime
 import collections
+import functools
+import json
+import os
 
 import inflection as inf
 
 import merakygen
+import merakygen._cache as cache
+import merakygen.build_manifest as bm
 import merakygen.create_function_docstring as docs
+from merakygen.endpoint import Endpoint, EndpointTable
 
 API_BASE_URL = 'https://api.meraki.com/api/v0'
+LANGUAGES = ['python', 'ruby', 'bash', 'powershell']
+# How the 2nd, 3rd... function with a taken name is renamed, per language.
+RENAME_FORMATS = {'python': '{}_{}', 'ruby': '{}_{}', 'bash': '{}_{}',
+                  'powershell': '{}{}'}
+# Functions that the runtime of each language defines, which a generated
+# function with the same name would replace. Python's are read from its
+# runtime by get_reserved_names.
+RESERVED_NAMES = {
+    'ruby': frozenset(['api_call', 'learn_shard', 'shard_key', 'shard_url']),
+    'bash': frozenset(),
+    'powershell': frozenset([
+        'Get-ShardKey', 'Get-ShardUrl', 'Invoke-ApiCall', 'JsonToHashtable',
+        'ParseParams', 'Print', 'Set-ShardUrl']),
+}
+# Python API calls that return a list also get a <name>_iter function.
+ITER_SUFFIX = '_iter'
+
+
+@functools.lru_cache(maxsize=None)
+def inflect(form, word):
+    """Get inflection's underscore/singularize/pluralize form of a word.
+
+    The inflection functions are regex heavy, and path segments like
+    networks, [networkId] and devices repeat across most of the spec, so
+    each segment is only inflected once.
+    """
+    return getattr(inf, form)(word)
 
 
 def get_http_stats(api_calls):
     """Per the API calls, get the number of each http type (GET, POST, ...)"""
-    http_types_list = [api_call['http_method'] for api_call in api_calls]
+    http_types_list = [api_call.http_method for api_call in api_calls]
     http_types_counts = dict(collections.Counter(http_types_list))
     return re.sub(r'[\']', '', str(http_types_counts))
 
@@ -75,7 +108,7 @@ def get_path_args(api_path, has_params):
             arg += '_number'
         if 's_' in arg:  # Remove needless plurals
             arg = arg.replace('s_', '_')
-        args[index] = inf.underscore(arg)
+        args[index] = inflect('underscore', arg)
 
     if has_params:
         args += ['params']
@@ -90,7 +123,7 @@ def get_formatted_url(api_call_path, has_params):
     request by adding them with string.format() in the end function."""
     # The variables that will end up being in the function
     func_vars = ', '.join(get_path_args(api_call_path, has_params))
-    func_vars = inf.underscore(func_vars)
+    func_vars = inflect('underscore', func_vars)
     temp_path = re.sub(r'[\[{][A-Za-z_-]*[\]}]', '{}', api_call_path)
 
     formatted_path = "'{}'.format({})".format(temp_path, func_vars)
@@ -111,15 +144,16 @@ def generate_api_call_words(http_type, api_path):
             word = '[id]'
         if word == '[service]':  # For FirewalledServices [service] variable
             word = '[type]'
-        word = inf.underscore(word)
+        word = inflect('underscore', word)
         is_get = http_type in ['get']
         if not is_get and 'settings' not in word:
-            word = inf.singularize(word)
+            word = inflect('singularize', word)
         if word[0] in ['[', '{']:
             word = word[1:-1]
             # First word is never [arg]
             word_before = path_words[::-1][i+1]
-            word_before = inf.singularize(inf.underscore(word_before))
+            word_before = inflect('singularize',
+                                  inflect('underscore', word_before))
             # Combines /networks/[networkId] => networkId
             if word_before not in word:
                 words = [word_before, word]
@@ -127,11 +161,11 @@ def generate_api_call_words(http_type, api_path):
                 words = [word]
             if i == 0:
                 if is_get:
-                    word_before = inf.pluralize(word_before)
+                    word_before = inflect('pluralize', word_before)
                 return [http_type] + [word_before] + ['by'] + words
             if i > 0:
                 if not is_get and 'settings' not in word_list[-1]:
-                    word_list[-1] = inf.singularize(word_list[-1])
+                    word_list[-1] = inflect('singularize', word_list[-1])
                 return [http_type] + word_list + ['by'] + words
         word_list.insert(0, word)
 
@@ -140,52 +174,204 @@ def generate_api_call_words(http_type, api_path):
 
 def generate_func_name(api_call, language):
     """Convert the api call words to a function name, per language."""
-    api_call_words = generate_api_call_words(
-        api_call['http_method'], api_call['path'])
-    # default is snake_case for ruby and python
-    if language in ['python', 'ruby']:
-        api_call_name = '_'.join(api_call_words)
-    elif language in ['go', 'javascript']:  # CamelCase
-        title_words = ''.join([word.title() for word in api_call_words])
-        api_call_name = title_words.title().replace('_', '')
-    else:  # powershell with Semi-CamelCase (Verb-NounNoun...)
-        # https://docs.microsoft.com/en-us/powershell/developer/cmdlet/approved-verbs-for-windows-powershell-commands
-        convert_to_approved_verb = {
-            'GET': 'Get', 'POST': 'Add', 'PUT': 'Set', 'DELETE': 'Remove'}
-        approved_verb = convert_to_approved_verb[api_call['http_method']]
-        nouns = ''.join([word.title() for word in api_call_words[1:]])
-        no_underscore_nouns = nouns.replace('_', '')
-        api_call_name = approved_verb + '-' + no_underscore_nouns
-
-    return api_call_name
-
+    return get_func_names(api_call, [language])[language]
 
-def modify_api_calls(api_json, options, language):
-    """Modify API calls in meaningful ways."""
-    api_calls = []
 
-    # Flatten API calls, but still record the section
-    for api_type in api_json:
-        for api_call in api_json[api_type]:
-            api_call['section'] = api_type
-            api_calls += [api_call]
+def get_func_names(api_call, languages):
+    """Get the function name of an api call for each language.
 
-    for index, api_call in enumerate(api_calls):
-        api_calls[index]['gen_name'] = generate_func_name(api_call, language)
+    The api call words are only generated once for all of the languages.
+    """
+    api_call_words = generate_api_call_words(
+        api_call.http_method, api_call.path)
+    func_names = {}
+    for language in languages:
+        # default is snake_case for ruby and python
+        if language in ['python', 'ruby']:
+            api_call_name = '_'.join(api_call_words)
+        elif language in ['go', 'javascript']:  # CamelCase
+            title_words = ''.join([word.title() for word in api_call_words])
+            api_call_name = title_words.title().replace('_', '')
+        else:  # powershell with Semi-CamelCase (Verb-NounNoun...)
+            # https://docs.microsoft.com/en-us/powershell/developer/cmdlet/approved-verbs-for-windows-powershell-commands
+            convert_to_approved_verb = {
+                'GET': 'Get', 'POST': 'Add', 'PUT': 'Set', 'DELETE': 'Remove'}
+            approved_verb = convert_to_approved_verb[api_call.http_method]
+            nouns = ''.join([word.title() for word in api_call_words[1:]])
+            no_underscore_nouns = nouns.replace('_', '')
+            api_call_name = approved_verb + '-' + no_underscore_nouns
+        func_names[language] = api_call_name
+
+    return func_names
+
+
+def get_symbol(func_name, language):
+    """Get what a function name is looked up by. Powershell ignores case."""
+    if language == 'powershell':
+        return func_name.lower()
+    return func_name
+
+
+def get_symbol_counts(func_names, language):
+    """Count the function names that would be the same function."""
+    return collections.Counter(get_symbol(func_name, language)
+                               for func_name in func_names)
+
+
+@functools.lru_cache(maxsize=None)
+def get_reserved_names(language):
+    """Get the names that the runtime of language defines."""
+    if language == 'python':
+        # The emitter is only imported by the stage that needs it.
+        # pylint: disable=import-outside-toplevel
+        import merakygen.make_python_script as mps
+        return mps.get_runtime_names()
+    return RESERVED_NAMES[language]
+
+
+def get_taken_symbols(func_name, language):
+    """Get the symbols a function name takes. In python, an API call may
+    also get a <name>_iter function."""
+    symbol = get_symbol(func_name, language)
+    if language == 'python':
+        return [symbol, symbol + ITER_SUFFIX]
+    return [symbol]
+
+
+def get_reserved_symbols(namesakes, language):
+    """Get {symbol: what uses it} of names that no API call can keep.
+
+    These are the names the runtime defines and, in python, the <name>_iter
+    function of every API call.
+    """
+    reserved = {get_symbol(name, language): 'the runtime'
+                for name in get_reserved_names(language)}
+    if language == 'python':
+        for symbol, same_name_calls in namesakes.items():
+            reserved.setdefault(symbol + ITER_SUFFIX, '{} ({})'.format(
+                same_name_calls[0].key, symbol + ITER_SUFFIX))
+    return reserved
+
+
+def resolve_name_collisions(api_calls, languages=None):
+    """Rename API calls whose function name another one already has.
+
+    Otherwise the last function with a name would silently replace the
+    others (like a later def in python). Each language's names are indexed
+    once, so this is O(n). The first API call keeps the name and the others
+    get a number after it, like get_orgs_2. API calls named like one of
+    get_reserved_symbols() are all numbered. Returns the collisions as
+    [(language, func_name, [endpoint key or other user, ...]), ...].
+    """
+    collisions = []
+    for language in languages or LANGUAGES:
+        namesakes = {}  # Symbol => API calls with that function name
+        for api_call in api_calls:
+            namesakes.setdefault(get_symbol(api_call.gen_names[language],
+                                            language), []).append(api_call)
+        reserved = get_reserved_symbols(namesakes, language)
+        taken = set(namesakes) | set(reserved)
+        for symbol, same_name_calls in namesakes.items():
+            users = [api_call.key for api_call in same_name_calls]
+            if symbol in reserved:
+                users.insert(0, reserved[symbol])
+                renamed_calls = same_name_calls
+            elif len(same_name_calls) > 1:
+                renamed_calls = same_name_calls[1:]
+            else:
+                continue
+            func_name = same_name_calls[0].gen_names[language]
+            collisions.append((language, func_name, users))
+            number = 1
+            for api_call in renamed_calls:
+                new_name = func_name
+                while not taken.isdisjoint(get_taken_symbols(new_name,
+                                                             language)):
+                    number += 1
+                    new_name = RENAME_FORMATS[language].format(func_name,
+                                                               number)
+                taken.update(get_taken_symbols(new_name, language))
+                api_call.gen_names[language] = new_name
+    return collisions
+
+
+def set_func_names(api_calls, language):
+    """Name the functions of modified API calls for language.
+
+    modify_api_calls names every API call for every language in gen_names,
+    so the rest of the modified API calls can be shared by all languages.
+    """
+    api_calls.set_language(language)
+    return api_calls
 
-        has_params = 'params' in api_call and api_call['params']
-        func_args = get_path_args(api_call['path'], has_params)
-        api_calls[index]['gen_func_args'] = ', '.join(func_args)
-        api_calls[index] = docs.get_function_docstring(api_call, func_args)
 
-        is_post_or_put = api_call['http_method'] in ['POST', 'PUT']
+def get_modified_api_calls(api_json):
+    """Get an EndpointTable of the API calls of api_json, with the names of
+    every language, and the name collisions that were resolved."""
+    # Flatten API calls, but still record the section
+    api_calls = EndpointTable(
+        Endpoint.from_spec(api_type, api_call)
+        for api_type in api_json for api_call in api_json[api_type])
+
+    for api_call in api_calls:
+        api_call.gen_names = get_func_names(api_call, LANGUAGES)
+    collisions = resolve_name_collisions(api_calls)
+    for api_call in api_calls:
+        has_params = bool(api_call.params)
+        func_args = get_path_args(api_call.path, has_params)
+        docs.get_function_docstring(api_call, func_args)
+
+        is_post_or_put = api_call.http_method in ['POST', 'PUT']
         # If put/post, then params will be requests' data={'key': 'value'}
         # If get, then params will be appended to url as ?key=value&key=value..
-        if 'params' in api_call:
-            api_calls[index]['gen_data'] = api_call['params']
-        else:
-            api_calls[index]['gen_data'] = ''
-        api_calls[index]['gen_formatted_url'] = get_formatted_url(
-            api_call['path'], has_params and is_post_or_put)
+        api_call.gen_formatted_url = get_formatted_url(
+            api_call.path, has_params and is_post_or_put)
 
-    return api_calls
+    return api_calls, collisions
+
+
+def print_name_collisions(collisions):
+    """Warn about the collisions that resolve_name_collisions returned."""
+    for collision in collisions:
+        msg = 'WARNING: Name collision in {}: `{}` is used by {}.\n'.format(
+            *collision[:2], ', '.join(collision[2])) + 4*' ' + \
+            'All but the first are numbered. Please create an issue.'
+        print(msg)
+
+
+def modify_api_calls(api_json, options, language):
+    """Get an EndpointTable of the API calls of api_json."""
+    api_calls, collisions = get_modified_api_calls(api_json)
+    print_name_collisions(collisions)
+    return set_func_names(api_calls, language)
+
+
+def get_api_calls(api_json, language, use_cache=True):
+    """Get modify_api_calls() of api_json, from the IR cache if possible.
+
+    API calls are named for every language and options only change the
+    output, so the 'ir' cache is keyed by the hash of the spec, version and
+    generator source. Each entry has the modified API calls (as json) and
+    the name collisions to warn about again. Warm runs load them instead of
+    doing all of the inflection work again.
+    """
+    ir_key = json.dumps([api_json, merakygen.__version__,
+                         bm.get_generator_hash()], sort_keys=True)
+    ir_file = os.path.join(cache.get_cache_dir('ir'),
+                           cache.get_hash(ir_key) + '.json')
+    api_calls = None
+    if use_cache and os.path.isfile(ir_file):
+        try:
+            with open(ir_file, encoding='utf-8') as file_obj:
+                ir_json = json.load(file_obj)
+            api_calls = EndpointTable.from_dicts(ir_json['endpoints'])
+            collisions = ir_json['collisions']
+        except (ValueError, KeyError, TypeError):  # Corrupt entries are rebuilt
+            api_calls = None
+    if api_calls is None:
+        api_calls, collisions = get_modified_api_calls(api_json)
+        if use_cache:
+            cache.write_atomic(ir_file, json.dumps({
+                'endpoints': api_calls.to_dicts(), 'collisions': collisions}))
+    print_name_collisions(collisions)
+    return set_func_names(api_calls, language)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Endpoints of the spec and what is generated for them.
+
+modify_api_calls makes an Endpoint of every api.json entry. Endpoints have
+__slots__ instead of a dict each, and an EndpointTable keeps them in spec
+order, indexed by (http_method, path), section and gen_name.
+"""
+import sys
+
+# The number of keys of an api.json entry (plus the section it is in) at the
+# start of Endpoint.__slots__. The rest are fields modify_api_calls generates.
+NUM_SPEC_FIELDS = 9
+
+
+def remove_item(items, item):
+    """Remove item itself from a list, and not an item equal to it."""
+    for index, other in enumerate(items):
+        if other is item:
+            del items[index]
+            return True
+    return False
+
+
+class Endpoint:
+    """One API call of the spec and the fields generated for it.
+
+    Usage:
+        endpoint = Endpoint.from_spec('Admins', api_json['Admins'][0])
+        endpoint.gen_name = endpoint.gen_names['python']
+    """
+    __slots__ = ('section', 'http_method', 'path', 'alternate_path',
+                 'sample_req', 'sample_resp', 'description', 'params',
+                 'successful_http_status',
+                 'gen_names', 'gen_name', 'gen_formatted_url', 'func_desc',
+                 'func_args', 'func_link', 'func_params', 'func_return_type')
+
+    def __init__(self, **fields):
+        self.section = fields.get('section')
+        self.http_method = fields.get('http_method')
+        self.path = fields.get('path')
+        self.alternate_path = fields.get('alternate_path')
+        self.sample_req = fields.get('sample_req')
+        self.sample_resp = fields.get('sample_resp')
+        self.description = fields.get('description')
+        self.params = fields.get('params')
+        self.successful_http_status = fields.get('successful_http_status')
+        self.gen_names = fields.get('gen_names')
+        self.gen_name = fields.get('gen_name')
+        self.gen_formatted_url = fields.get('gen_formatted_url')
+        self.func_desc = fields.get('func_desc')
+        self.func_args = fields.get('func_args')
+        self.func_link = fields.get('func_link')
+        self.func_params = fields.get('func_params')
+        self.func_return_type = fields.get('func_return_type')
+
+    @classmethod
+    def from_spec(cls, section, spec):
+        """Make an endpoint from the api.json entry of a section."""
+        endpoint = cls(**{field: spec.get(field) for field in SPEC_FIELDS})
+        # Every endpoint of a section shares one string, and so on.
+        endpoint.section = sys.intern(section)
+        endpoint.http_method = sys.intern(endpoint.http_method)
+        return endpoint
+
+    @property
+    def key(self):
+        """The key that identifies an endpoint, like 'GET /organizations'."""
+        return self.http_method + ' ' + self.path
+
+    @property
+    def gen_func_args(self):
+        """The args of the generated function, like 'org_id, params'."""
+        return ', '.join(self.func_args or {})
+
+    def get_spec(self):
+        """Get the api.json entry (and section) of the endpoint."""
+        return {field: getattr(self, field) for field in SPEC_FIELDS}
+
+    def to_dict(self):
+        """Get every field, like for json.dumps."""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, Endpoint):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None  # Endpoints are mutable.
+
+    def __repr__(self):
+        return 'Endpoint({!r})'.format(self.key)
+
+
+class EndpointTable:
+    """Endpoints in spec order, indexed by (http_method, path), section and
+    gen_name. Iterate over it like a list of endpoints.
+
+    gen_name is set per language with set_language, and should only be
+    changed with rename so that the index stays up to date.
+    """
+    def __init__(self, endpoints=()):
+        self.endpoints = []
+        self.by_key = {}  # (http_method, path) => endpoint
+        self.by_section = {}  # section => [endpoint, ...]
+        self.by_gen_name = {}  # gen_name => [endpoint, ...]
+        for endpoint in endpoints:
+            self.add(endpoint)
+
+    @classmethod
+    def from_dicts(cls, endpoint_dicts):
+        """Make a table from Endpoint.to_dict() of each endpoint."""
+        return cls(Endpoint(**fields) for fields in endpoint_dicts)
+
+    def to_dicts(self):
+        """Get Endpoint.to_dict() of each endpoint, like for json.dumps."""
+        return [endpoint.to_dict() for endpoint in self.endpoints]
+
+    def add(self, endpoint):
+        """Add an endpoint after the others."""
+        self.endpoints.append(endpoint)
+        self.by_key[(endpoint.http_method, endpoint.path)] = endpoint
+        self.by_section.setdefault(endpoint.section, []).append(endpoint)
+        if endpoint.gen_name is not None:
+            self.by_gen_name.setdefault(endpoint.gen_name, []).append(endpoint)
+
+    def remove(self, endpoint):
+        """Remove an endpoint from the table and its indexes."""
+        remove_item(self.endpoints, endpoint)
+        del self.by_key[(endpoint.http_method, endpoint.path)]
+        remove_item(self.by_section[endpoint.section], endpoint)
+        if not self.by_section[endpoint.section]:
+            del self.by_section[endpoint.section]
+        self.unindex_gen_name(endpoint)
+
+    def pop(self, index=-1):
+        """Remove and get the endpoint at index (the last by default)."""
+        endpoint = self.endpoints[index]
+        self.remove(endpoint)
+        return endpoint
+
+    def unindex_gen_name(self, endpoint):
+        """Remove an endpoint from the gen_name index."""
+        namesakes = self.by_gen_name.get(endpoint.gen_name, [])
+        if remove_item(namesakes, endpoint) and not namesakes:
+            del self.by_gen_name[endpoint.gen_name]
+
+    def rename(self, endpoint, gen_name):
+        """Change the gen_name of an endpoint."""
+        self.unindex_gen_name(endpoint)
+        endpoint.gen_name = gen_name
+        self.by_gen_name.setdefault(gen_name, []).append(endpoint)
+
+    def set_language(self, language):
+        """Name every endpoint with its gen_names of language."""
+        self.by_gen_name = {}
+        for endpoint in self.endpoints:
+            endpoint.gen_name = endpoint.gen_names[language]
+            self.by_gen_name.setdefault(endpoint.gen_name, []).append(endpoint)
+
+    def get(self, http_method, path):
+        """Get the endpoint of an http method and path, if there is one."""
+        return self.by_key.get((http_method, path))
+
+    def get_section(self, section):
+        """Get the endpoints of a section, in spec order."""
+        return self.by_section.get(section, [])
+
+    def get_by_gen_name(self, gen_name):
+        """Get the endpoints named gen_name (more than one is a collision)."""
+        return self.by_gen_name.get(gen_name, [])
+
+    def __iter__(self):
+        return iter(self.endpoints)
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return EndpointTable(self.endpoints[index])
+        return self.endpoints[index]
+
+    def __eq__(self, other):
+        if not isinstance(other, EndpointTable):
+            return NotImplemented
+        return self.endpoints == other.endpoints
+
+    __hash__ = None
+
+
+SPEC_FIELDS = Endpoint.__slots__[:NUM_SPEC_FIELDS]
+GEN_FIELDS = Endpoint.__slots__[NUM_SPEC_FIELDS:]
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Lint generated code one part (function or section) at a time.
+
+Each part is linted in its own file, with all uncached parts in one call of
+the linter so that it can spread them across cores. Messages are cached by
+the hash of the part's text, so only new or changed code is linted again.
+"""
+import ast
+import json
+import os
+import subprocess as sp
+import sys
+import tempfile
+
+import merakygen._cache as cache
+
+# Disable large file error (by design), and too few/many public methods
+# Some classes will have 1 function and SM has 37.
+PYLINT_DISABLE = ['C0302', 'R0903', 'R0904']
+# A part on its own has no module docstring. Function parts import the
+# names they use from the runtime part (see add_runtime_import).
+PYLINT_PART_DISABLE = ['C0114']
+# Checks across functions that parts on their own would miss, run once on
+# the whole module.
+PYLINT_MODULE_ENABLE = ['E0102', 'E0602']
+RUNTIME_MODULE = '_runtime'
+PYLINT_CMD = [sys.executable, '-m', 'pylint']
+RUBOCOP_CMD = ['rubocop']
+# Return codes of linters that ran (whether or not they found issues).
+# Pylint's are bit flags of what it found, where 1 is fatal and 32 is a
+# usage error. Rubocop's are 0 (clean), 1 (offenses) and 2 (error).
+PYLINT_OK_CODES = frozenset(range(0, 32, 2))
+RUBOCOP_OK_CODES = frozenset([0, 1])
+
+
+def get_pylint_options():
+    """Get the pylint options to lint parts with, using every core."""
+    return ['--jobs=0', '--output-format=json', '--persistent=n',
+            '--disable=' + ','.join(PYLINT_DISABLE + PYLINT_PART_DISABLE)]
+
+
+def get_pylint_module_options():
+    """Get the pylint options to check a whole module for PYLINT_MODULE_ENABLE.
+    """
+    return ['--output-format=json', '--persistent=n', '--disable=all',
+            '--enable=' + ','.join(PYLINT_MODULE_ENABLE)]
+
+
+def get_defined_names(text):
+    """Get the names that python code defines at the top level."""
+    names = set()
+    for node in ast.parse(text).body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                             ast.ClassDef)):
+            names.add(node.name)
+            continue
+        # Like assignments and imports, also in try: or if: blocks.
+        for child in ast.walk(node):
+            if isinstance(child, (ast.Import, ast.ImportFrom)):
+                names.update((alias.asname or alias.name).split('.')[0]
+                             for alias in child.names)
+            elif isinstance(child, ast.Name) and \
+                    isinstance(child.ctx, ast.Store):
+                names.add(child.id)
+    return names
+
+
+def add_runtime_import(text, runtime_names):
+    """Import the names a function part uses from the runtime part.
+
+    The import takes the place of the part's leading newline, so line
+    numbers stay the same. Names the runtime does not define are left out,
+    so pylint still reports them as undefined.
+    """
+    try:
+        used_names = {node.id for node in ast.walk(ast.parse(text))
+                      if isinstance(node, ast.Name)}
+    except SyntaxError:  # Pylint reports it
+        return text
+    names = sorted(used_names & runtime_names)
+    if not names or not text.startswith('\n'):
+        return text
+    return 'from {} import {}  # pylint: disable=line-too-long{}'.format(
+        RUNTIME_MODULE, ', '.join(names), text)
+
+
+def parse_pylint_output(stdout):
+    """Get {filename: [message, ...]} from pylint's json output."""
+    messages = {}
+    for msg in json.loads(stdout or '[]'):
+        messages.setdefault(msg['path'], []).append('{}:{}: {} ({}) {}'.format(
+            msg['line'], msg['column'], msg['message-id'], msg['symbol'],
+            msg['message']))
+    return messages
+
+
+def get_rubocop_options(config_file):
+    """Get the rubocop options to lint parts with, using every core."""
+    return ['--parallel', '--format', 'json', '--config',
+            os.path.abspath(config_file)]
+
+
+def parse_rubocop_output(stdout):
+    """Get {filename: [message, ...]} from rubocop's json output."""
+    messages = {}
+    for file_info in json.loads(stdout)['files']:
+        messages[os.path.basename(file_info['path'])] = [
+            '{}:{}: {} {}'.format(
+                offense['location']['line'], offense['location']['column'],
+                offense['cop_name'], offense['message'])
+            for offense in file_info['offenses']]
+    return messages
+
+
+def lint_parts(text_parts, tool_cmd, tool_options, parse_output, ok_codes,
+               suffix, config_text='', support_files=None):
+    """Lint each part of generated code and get [[message, ...], ...].
+
+    Args:
+        text_parts (list): Text of each function or section.
+        tool_cmd (list): Linter command, like PYLINT_CMD.
+        tool_options (list): Linter options. Files are added after them.
+        parse_output (func): Gets {filename: [message, ...]} from stdout.
+        ok_codes (set): Return codes of the linter when it did not fail.
+        suffix (str): File extension of the language, like '.py'.
+        config_text (str): Text of the linter's config file, if any.
+        support_files (dict): {filename: text} of files that parts use but
+            that are not linted, like the runtime module.
+    Returns:
+        A list of messages for each part. Empty if the part is clean.
+    Raises:
+        RuntimeError: If the linter failed. Nothing is cached then.
+    """
+    cache_dir = cache.get_cache_dir('lint')
+    # Cached messages are only valid for the same linter version and options.
+    tool_version = sp.run(tool_cmd + ['--version'], stdout=sp.PIPE,
+                          check=True, universal_newlines=True).stdout
+    support_files = support_files or {}
+    key_prefix = tool_version + ' '.join(tool_options) + config_text + \
+        json.dumps(support_files, sort_keys=True)
+    part_messages = [None] * len(text_parts)
+    uncached = {}  # Part filename => indexes of parts with its text
+    for index, text in enumerate(text_parts):
+        part_hash = cache.get_hash(key_prefix + text)
+        try:
+            with open(os.path.join(cache_dir, part_hash + '.json'),
+                      encoding='utf-8') as file_obj:
+                part_messages[index] = json.load(file_obj)
+        except (OSError, ValueError):
+            uncached.setdefault('part_' + part_hash + suffix, []).append(index)
+    if not uncached:
+        return part_messages
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_texts = dict(support_files)
+        for filename, indexes in uncached.items():
+            file_texts[filename] = text_parts[indexes[0]]
+        for filename, text in file_texts.items():
+            with open(os.path.join(temp_dir, filename), 'w',
+                      encoding='utf-8') as file_obj:
+                file_obj.write(text)
+        result = sp.run(tool_cmd + tool_options + sorted(uncached),
+                        cwd=temp_dir, stdout=sp.PIPE, stderr=sp.PIPE,
+                        check=False, universal_newlines=True)
+    try:
+        if result.returncode not in ok_codes:
+            raise ValueError('exit code {}'.format(result.returncode))
+        messages = parse_output(result.stdout)
+    except (ValueError, KeyError, TypeError) as error:
+        raise RuntimeError('{} failed ({}): {}'.format(
+            ' '.join(tool_cmd), error, result.stderr.strip())) from error
+    for filename, indexes in uncached.items():
+        cache_file = os.path.join(cache_dir, filename[len('part_'):-len(
+            suffix)] + '.json')
+        cache.write_atomic(cache_file, json.dumps(messages.get(filename, [])))
+        for index in indexes:
+            part_messages[index] = messages.get(filename, [])
+    return part_messages
@@ -15,10 +15,13 @@
 """Generate bash script."""
 import re
 
+import merakygen._cache as cache
+import merakygen._timings as timings
+import merakygen.build_manifest as bm
 
-def make_bash_function(func_name, func_params, func_desc, sample_req):
+
+def make_bash_function(func_name, func_desc, sample_req):
     """Should work for HTTP GET"""
-    print(func_params)
     function_text = """
 
 {}
@@ -32,36 +35,54 @@ def make_bash_function(func_name, func_params, func_desc, sample_req):
     return function_text
 
 
-def make_bash_script(api_key, api_calls, preamble):
+def make_bash_script(api_key, api_calls, preamble, options):
     """Make bash script."""
+    output_file = 'meraki_api.sh'
+    manifest = bm.BuildManifest('.', output_file, 'bash', options)
     preamble = '#!/bin/bash\n' + preamble
     # Put a '# ' in front of every line except first ^.
-    generated_text = preamble.replace('\n', '\n# ')[:-2]
-    generated_text += '\nAPIKEY=' + api_key
-    generated_text += '\nBASEURL=https://api.meraki.com/api/v0\n'
-    for api_call in api_calls:
-        sample_req = api_call['sample_req'].replace('<key>', '$APIKEY')
-        # Each curl option gets its own line. Don't split if it is already.
-        if '\n' not in sample_req:
-            sample_req = sample_req.replace(' -', '\\\n    -')
-        else:
-            sample_req = sample_req.replace('\n  -', '\n    -')
-        num_path_params = len(re.findall(r'[\[{]', api_call['path']))
-        # Create a list like ['$1', '$2', '$3', '$4', '$5'] for formatting
-        var_list = ['${}'.format(i) for i in range(1, num_path_params+1)]
-        api_path = '$BASEURL' + re.sub(
-            r'[\[{][A-Za-z-_]*?[\]}]', '{}', api_call['path'])
-        api_path = api_path.format(* var_list)
-        sample_req = re.sub(r'\'https.*?\'', api_path, sample_req)
-        func_desc = '# ' + api_call['gen_func_desc'].replace('\n    ', '\n# ')
-        generated_text += make_bash_function(
-            api_call['gen_name'],
-            api_call['gen_params'],
-            func_desc,
-            sample_req,
-        ) + '\n'
+    preamble = preamble.replace('\n', '\n# ')[:-2]
+    runtime_text = '\nAPIKEY=' + api_key
+    runtime_text += '\nBASEURL=https://api.meraki.com/api/v0\n'
+    manifest.add_section('runtime', runtime_text)
+    # Functions are joined once at the end instead of copying the whole
+    # text for each one.
+    text_parts = [preamble, runtime_text]
+    with timings.stage('bash.emit'):
+        for api_call in api_calls:
+            function_text = manifest.get_text(api_call)
+            if function_text is not None:  # Unchanged since last run
+                text_parts.append(function_text)
+                manifest.add(api_call, function_text)
+                continue
+            sample_req = api_call.sample_req.replace('<key>', '$APIKEY')
+            # Each curl option gets its own line. Don't split if it is already.
+            if '\n' not in sample_req:
+                sample_req = sample_req.replace(' -', '\\\n    -')
+            else:
+                sample_req = sample_req.replace('\n  -', '\n    -')
+            num_path_params = len(re.findall(r'[\[{]', api_call.path))
+            # Create a list like ['$1', '$2', '$3', '$4', '$5'] for formatting
+            var_list = ['${}'.format(i) for i in range(1, num_path_params+1)]
+            api_path = '$BASEURL' + re.sub(
+                r'[\[{][A-Za-z-_]*?[\]}]', '{}', api_call.path)
+            api_path = api_path.format(* var_list)
+            sample_req = re.sub(r'\'https.*?\'', api_path, sample_req)
+            func_desc = '# ' + api_call.func_desc.replace('\n', '\n# ')
+            function_text = make_bash_function(
+                api_call.gen_name,
+                func_desc,
+                sample_req,
+            ) + '\n'
+            text_parts.append(function_text)
+            manifest.add(api_call, function_text)
 
-    print(generated_text)
-    with open('meraki_api.sh', 'w') as myfile:
-        myfile.write(generated_text)
+    generated_text = ''.join(text_parts)
+    if manifest.is_up_to_date():
+        print('\t- ' + output_file + ' is up to date')
+    else:
+        print('\t- saving ' + output_file + ' ...')
+        with timings.stage('bash.write'):
+            cache.write_atomic(output_file, generated_text)
+    manifest.save()
     return generated_text
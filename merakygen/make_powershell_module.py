@@ -13,15 +13,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Generate a powershell module."""
+import contextlib
+import datetime
 import re
 import os
-import subprocess as sp
 import shutil
 import textwrap
+import uuid
 
 import inflection as inf
 
 import merakygen
+import merakygen._cache as cache
+import merakygen._timings as timings
+import merakygen.build_manifest as bm
+import merakygen.create_method as make_method
 
 
 def make_function(func_name, func_desc, func_args_descs,
@@ -212,30 +218,24 @@ def get_func_inputs():
 def make_classes(api_calls):
     """Add class headers and indent all functions once.
 
-    Go through API calls and group them by section. Then add the sections
+    Go through the sections of the API calls. Then add the sections
     together into a string.
     """
-    api_sections = {}
     generated_text = ''
-    for api_call in api_calls:
-        section_name = api_call['section'].title().replace(' ', '')
-        if section_name not in api_sections:
-            api_sections[section_name] = []
-        api_sections[section_name].append(api_call)
-
     whitespace_between_methods = '\n'
-    for section in api_sections:
+    for section, section_calls in api_calls.by_section.items():
         generated_text += """\
 \n\nclass {0}:
-    \"\"\"Class to access {0} functions.\"\"\"""".format(section)
+    \"\"\"Class to access {0} functions.\"\"\"""".format(
+            section.title().replace(' ', ''))
 
-        for api_call in api_sections[section]:
+        for api_call in section_calls:
             function_text = '\n@staticmethod' + make_function(
-                func_name=api_call['gen_name'],
-                func_desc=api_call['gen_func_desc'],
-                func_args=api_call['gen_func_args'],
-                req_http_type=api_call['http_method'],
-                url_path=api_call['gen_formatted_url'])
+                func_name=api_call.gen_name,
+                func_desc=api_call.func_desc,
+                func_args=api_call.gen_func_args,
+                req_http_type=api_call.http_method,
+                url_path=api_call.gen_formatted_url)
             function_text += whitespace_between_methods
             # Class methods are indented one more than functions.
             indent_regex = r'\n([ ]*?[\S]+?)'  # Only indent text, not \n
@@ -244,17 +244,182 @@ def make_classes(api_calls):
     return generated_text
 
 
+# Lines of the preamble that change every run. Functions leave them out so
+# that unchanged endpoints keep the same text.
+RUN_SPECIFIC_LINES = re.compile(r'^(Generated @|[ ]*API calls:) .*\n', re.M)
+
+# New-ModuleManifest's template, so that the psd1 can be written without pwsh.
+# pylint: disable=line-too-long
+PS_MODULE_MANIFEST = """\
+#
+# Module manifest for module '{module}'
+#
+# Generated by: {generated_by}
+#
+# Generated on: {generated_on}
+#
+
+@{{
+
+# Script module or binary module file associated with this manifest.
+RootModule = {RootModule}
+
+# Version number of this module.
+ModuleVersion = {ModuleVersion}
+
+# Supported PSEditions
+# CompatiblePSEditions = @()
+
+# ID used to uniquely identify this module
+GUID = {GUID}
+
+# Author of this module
+Author = {Author}
+
+# Company or vendor of this module
+CompanyName = {CompanyName}
+
+# Copyright statement for this module
+Copyright = {Copyright}
+
+# Description of the functionality provided by this module
+Description = {Description}
+
+# Minimum version of the PowerShell engine required by this module
+PowerShellVersion = {PowerShellVersion}
+
+# Name of the PowerShell host required by this module
+# PowerShellHostName = ''
+
+# Minimum version of the PowerShell host required by this module
+# PowerShellHostVersion = ''
+
+# Minimum version of Microsoft .NET Framework required by this module. This prerequisite is valid for the PowerShell Desktop edition only.
+# DotNetFrameworkVersion = ''
+
+# Minimum version of the common language runtime (CLR) required by this module. This prerequisite is valid for the PowerShell Desktop edition only.
+# CLRVersion = ''
+
+# Processor architecture (None, X86, Amd64) required by this module
+# ProcessorArchitecture = ''
+
+# Modules that must be imported into the global environment prior to importing this module
+# RequiredModules = @()
+
+# Assemblies that must be loaded prior to importing this module
+# RequiredAssemblies = @()
+
+# Script files (.ps1) that are run in the caller's environment prior to importing this module.
+# ScriptsToProcess = @()
+
+# Type files (.ps1xml) to be loaded when importing this module
+# TypesToProcess = @()
+
+# Format files (.ps1xml) to be loaded when importing this module
+# FormatsToProcess = @()
+
+# Modules to import as nested modules of the module specified in RootModule/ModuleToProcess
+# NestedModules = @()
+
+# Functions to export from this module, for best performance, do not use wildcards and do not delete the entry, use an empty array if there are no functions to export.
+FunctionsToExport = {FunctionsToExport}
+
+# Cmdlets to export from this module, for best performance, do not use wildcards and do not delete the entry, use an empty array if there are no cmdlets to export.
+CmdletsToExport = '*'
+
+# Variables to export from this module
+VariablesToExport = '*'
+
+# Aliases to export from this module, for best performance, do not use wildcards and do not delete the entry, use an empty array if there are no aliases to export.
+AliasesToExport = '*'
+
+# DSC resources to export from this module
+# DscResourcesToExport = @()
+
+# List of all modules packaged with this module
+# ModuleList = @()
+
+# List of all files packaged with this module
+# FileList = @()
+
+# Private data to pass to the module specified in RootModule/ModuleToProcess. This may also contain a PSData hashtable with additional module metadata used by PowerShell.
+PrivateData = @{{
+
+    PSData = @{{
+
+        # Tags applied to this module. These help with module discovery in online galleries.
+        Tags = {Tags}
+
+        # A URL to the license for this module.
+        LicenseUri = {LicenseUri}
+
+        # A URL to the main website for this project.
+        ProjectUri = {ProjectUri}
+
+        # A URL to an icon representing this module.
+        # IconUri = ''
+
+        # ReleaseNotes of this module
+        ReleaseNotes = {ReleaseNotes}
+
+    }} # End of PSData hashtable
+
+}} # End of PrivateData hashtable
+
+# HelpInfo URI of this module
+HelpInfoURI = {HelpInfoURI}
+
+# Default prefix for commands exported from this module. Override the default prefix using Import-Module -Prefix.
+# DefaultCommandPrefix = ''
+
+}}
+
+"""
+# pylint: enable=line-too-long
+# New-ModuleManifest wraps lists once a line has more than this many chars
+# of quoted names (not counting the ", " between them).
+PS_LIST_WIDTH = 80
+PS_LIST_INDENT = 15
+
+
 class MakePSModule:
     """Make a powershell module.
 
     Structure taken from https://github.com/pcgeek86/PSGitHub
+
+    With single_file, the module is only a .psm1 of every function and the
+    .psd1, as Import-Module of one file is much faster than dot-sourcing one
+    file per function.
     """
-    def __init__(self, module):
+    def __init__(self, module, single_file=False):
         self.module = module
-        self.make_folders()
-        self.copy_entrypoint()
-        self.copy_private_functions()
-        self.make_module_manifest()
+        self.remove_other_layout(single_file)
+        if single_file:
+            self.root_module = module + '.psm1'
+            os.makedirs(module, exist_ok=True)
+        else:
+            self.root_module = 'MerakiAPI.psm1'
+            self.make_folders()
+            self.copy_entrypoint()
+            self.copy_private_functions()
+
+    def remove_other_layout(self, single_file):
+        """Remove the files of the other layout (and its build manifest), so
+        that switching --single-file on or off does not leave them behind."""
+        if single_file:
+            folders = ['Classes', 'Functions']
+            files = ['MerakiAPI.psm1', bm.get_manifest_filename(
+                '', self.module + '.psd1')]
+        else:
+            folders = []
+            files = [self.module + '.psm1', bm.get_manifest_filename(
+                '', self.module + '.psm1')]
+        for folder in folders:
+            shutil.rmtree(os.path.join(self.module, folder),
+                          ignore_errors=True)
+        for file in files:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.module, file))
 
     def make_folders(self):
         """Make folders for Powershell module structure.
@@ -279,65 +444,89 @@ class MakePSModule:
 
     def copy_entrypoint(self):
         """Copy the required entrypoint .psm1 file to the module."""
-        shutil.copy('../static/powershell/MerakiAPI.psm1', self.module)
+        bm.copy_if_changed('../static/powershell/MerakiAPI.psm1', self.module)
 
     def copy_private_functions(self):
         """Copy shared private functions that generated functions use."""
         files = os.listdir('../static/powershell/Private')
         for file in files:
             file = os.path.abspath('../static/powershell/Private/' + file)
-            shutil.copy(file, self.module + '/Functions/Private')
-
-    def find_ps_functions(self):
-        """Find all powershell functions in folder and return the list."""
-        ps_files = os.listdir(self.module + '/Functions/Public')
-        return [ps_file.replace('.ps1', '') for ps_file in ps_files]
+            bm.copy_if_changed(file, self.module + '/Functions/Private')
 
     @staticmethod
-    def convert_py_list_to_ps_list(python_list):
-        """Convert a python list (str) to a powershell list (str)."""
-        return '@(' + str(python_list)[1:-1] + ')'
-
-    def make_module_manifest(self):
+    def read_private_functions():
+        """Read the shared private functions to put them in a single file."""
+        private_texts = []
+        for file in sorted(os.listdir('../static/powershell/Private')):
+            with open('../static/powershell/Private/' + file,
+                      encoding='utf-8') as file_obj:
+                private_texts.append(file_obj.read().rstrip('\n') + '\n\n')
+        return ''.join(private_texts)
+
+    def make_module_manifest(self, func_names):
         """Generate the psd1 file required for PS packages."""
-        base_filename = os.getcwd() + '/' + self.module + '/'
-        ps_function_list = self.find_ps_functions()
-        ps_function_str = self.convert_py_list_to_ps_list(ps_function_list)
-        # Cannot supply entire changelog as max for -ReleaseNotes is 840 chars.
         author_info = merakygen.__author__ + ' <' + merakygen.__contact__ + '>'
         license_path = '/blob/master/LICENSE.txt'
-        powershell_cmd = 'pwsh'
-        cmd_list = [
-            powershell_cmd, '-Command', 'New-ModuleManifest',
-            '-Path', base_filename + self.module + '.psd1',
-            '-PowerShellVersion', '5.0',
-            '-Author', author_info,
-            '-CompanyName', merakygen.__author__,
-            '-Copyright', merakygen.__copyright__,
-            '-ModuleVersion', merakygen.__version__,
-            '-Description', merakygen.__description__,
-            '-Tags', '@(' + ', '.join(merakygen.__tags__) + ')',
-            '-HelpInfoUri', merakygen.__project_url__,
-            '-ProjectUri', merakygen.__project_url__,
-            '-LicenseUri', merakygen.__project_url__ + license_path,
-            '-ReleaseNotes', merakygen.__changelog__,
-            '-FunctionsToExport', ps_function_str,
-            '-RootModule', base_filename + self.module + '.psm1',
-        ]
-        # Sanitize after assigning for readability.
-        for index, cmd in enumerate(cmd_list):
-            cmd_list[index] = ps_sanitize(cmd)
-        sp_pipe = sp.Popen(cmd_list, stdout=sp.PIPE, stderr=sp.PIPE)
-        sp_outputs = sp_pipe.communicate()
-        if sp_outputs[0] or sp_outputs[1]:
-            print("PS MODULE STDOUT: " + sp_outputs[0].decode('utf-8') +
-                  "PS MODULE STDERR: " + sp_outputs[1].decode('utf-8'))
-
+        # The GUID should stay the same between builds of the same module.
+        module_guid = uuid.uuid5(uuid.NAMESPACE_URL,
+                                 merakygen.__project_url__ + '/' + self.module)
+        psd1_text = make_psd1_text(self.module, {
+            'RootModule': self.root_module,
+            'ModuleVersion': merakygen.__version__,
+            'GUID': str(module_guid),
+            'Author': author_info,
+            'CompanyName': merakygen.__author__,
+            'Copyright': merakygen.__copyright__,
+            'Description': merakygen.__description__,
+            'PowerShellVersion': '5.0',
+            'FunctionsToExport': func_names,
+            'Tags': merakygen.__tags__,
+            'LicenseUri': merakygen.__project_url__ + license_path,
+            'ProjectUri': merakygen.__project_url__,
+            'ReleaseNotes': merakygen.__changelog__,
+            'HelpInfoURI': merakygen.__project_url__,
+        })
+        cache.write_atomic(self.module + '/' + self.module + '.psd1', psd1_text)
+
+
+def ps_quote(text):
+    """Quote a string for powershell, where only ' needs escaping (as '')."""
+    return "'" + text.replace("'", "''") + "'"
+
+
+def ps_quote_list(names):
+    """Quote a list like New-ModuleManifest, wrapping lines at ~80 chars."""
+    if not names:
+        return '@()'
+    quoted_names = []
+    offset = PS_LIST_INDENT
+    for name in names:
+        quoted_name = ps_quote(name)
+        offset += len(quoted_name)
+        if offset > PS_LIST_WIDTH:
+            quoted_name = '\n' + PS_LIST_INDENT * ' ' + quoted_name
+            offset = PS_LIST_INDENT + len(quoted_name.lstrip())
+        quoted_names.append(quoted_name)
+    return ', '.join(quoted_names)
+
+
+def make_psd1_text(module, fields, generated_on=None):
+    """Get the text of a psd1 module manifest like New-ModuleManifest makes.
 
-def ps_sanitize(text):
-    """Add powershell escape chars to strings sent to powershell"""
-    text = re.sub(r'([ $#`<>])', '`\\1', text)
-    return text.replace('\n', '`n').replace('\t', '`t')
+    Args:
+        module (str): Name of the module.
+        fields (dict): psd1 key => str, or list for FunctionsToExport/Tags.
+        generated_on (datetime.date): Date in the header (default today).
+    Returns:
+        The psd1 text.
+    """
+    generated_on = generated_on or datetime.date.today()
+    quoted_fields = {
+        key: ps_quote_list(value) if isinstance(value, list)
+        else ps_quote(value) for key, value in fields.items()}
+    return PS_MODULE_MANIFEST.format(
+        module=module, generated_by=fields['Author'],
+        generated_on=generated_on.strftime('%m/%d/%Y'), **quoted_fields)
 
 
 def truncate_func_name(api_calls):
@@ -347,48 +536,123 @@ def truncate_func_name(api_calls):
     may not be helpful in usage.
 
     If removing ByNoun... would produce a collision, keep all function names
-    that would produce that collision.
+    that would produce that collision. The truncated names are counted once,
+    so this is O(n).
     """
-    api_calls_sans_by = [re.sub(r'By.*$', '', api_call['gen_name'])
-                         for api_call in api_calls]
-    for api_call in api_calls:
-        truncated_name = re.sub(r'By.*$', '', api_call['gen_name'])
-        name_collision_exists = api_calls_sans_by.count(truncated_name) > 1
-        if not name_collision_exists:
-            api_call['gen_name'] = truncated_name
+    truncated_names = [re.sub(r'By.*$', '', api_call.gen_name)
+                       for api_call in api_calls]
+    symbol_counts = make_method.get_symbol_counts(truncated_names,
+                                                  'powershell')
+    for api_call, truncated_name in zip(api_calls, truncated_names):
+        symbol = make_method.get_symbol(truncated_name, 'powershell')
+        if symbol_counts[symbol] == 1:
+            api_calls.rename(api_call, truncated_name)
 
     return api_calls
 
 
+def get_function_preamble(preamble):
+    """Get the preamble without its date and API call count."""
+    return RUN_SPECIFIC_LINES.sub('', preamble)
+
+
+def make_powershell_function(api_call, preamble, options):
+    """Make the text of the powershell function of an API call."""
+    sample_resp = ''
+    if '--sample-resp' in options:
+        sample_resp = api_call.sample_resp
+    api_call_function_comment = make_function_comment(
+        preamble,
+        api_call.func_desc,
+        api_call.func_args,
+        api_call.func_link,
+        api_call.func_params,
+        api_call.func_return_type,
+        api_call.path,
+        sample_resp)
+    return make_function(
+        func_name=api_call.gen_name,
+        func_desc=api_call_function_comment,
+        func_args_descs=api_call.func_args,
+        req_http_type=api_call.http_method,
+        url_path=api_call.path) \
+        + '\n'
+
+
+def make_single_file_module(ps_module, api_calls, preamble, options):
+    """Write every function into one .psm1 with an explicit export list."""
+    module_name = ps_module.module
+    func_preamble = get_function_preamble(preamble)
+    # The psd1 of both layouts is the same file, with another RootModule.
+    manifest = bm.BuildManifest(module_name, ps_module.root_module,
+                                'powershell', options,
+                                [ps_module.root_module, func_preamble])
+    private_text = ps_module.read_private_functions()
+    manifest.add_section('private', private_text)
+    # Functions are joined once at the end instead of copying the whole
+    # text for each one. The whole preamble is only in the header.
+    text_parts = ['<#\n' + preamble + '\n#>\n\n', private_text]
+    with timings.stage('powershell.emit'):
+        for api_call in api_calls:
+            function_text = manifest.get_text(api_call)
+            if function_text is None:  # New or changed since last run
+                function_text = make_powershell_function(
+                    api_call, func_preamble, options) + '\n'
+            text_parts.append(function_text)
+            manifest.add(api_call, function_text)
+    func_names = [api_call.gen_name for api_call in api_calls]
+    text_parts.append('Export-ModuleMember -Function ' +
+                      ps_quote_list(func_names) + '\n')
+    if manifest.is_up_to_date():
+        print('\t- ' + ps_module.root_module + ' is up to date')
+    else:
+        print('\t- saving ' + ps_module.root_module + ' ...')
+        with timings.stage('powershell.write'):
+            cache.write_atomic(module_name + '/' + ps_module.root_module,
+                               ''.join(text_parts))
+            ps_module.make_module_manifest(func_names)
+    manifest.save()
+
+
 def make_powershell_script(api_key, api_calls, preamble, options):
     """Make powershell script."""
     module_name = 'ps_merakygen'
-    MakePSModule(module=module_name)
+    if '--single-file' in options:
+        ps_module = MakePSModule(module=module_name, single_file=True)
+        make_single_file_module(ps_module, api_calls, preamble, options)
+        print("\nPowershell module generated!")
+        return
+    ps_module = MakePSModule(module=module_name)
+    func_preamble = get_function_preamble(preamble)
+    manifest = bm.BuildManifest(module_name, module_name + '.psd1',
+                                'powershell', options,
+                                [ps_module.root_module, func_preamble])
 
     public_func_dir = os.getcwd() + '/' + module_name + '/Functions/Public'
-    sample_resp = ''
     for api_call in api_calls:
-        if '--sample-resp' in options:
-            sample_resp = api_call['sample_resp']
-        api_call_function_comment = make_function_comment(
-            preamble,
-            api_call['func_desc'],
-            api_call['func_args'],
-            api_call['func_link'],
-            api_call['func_params'],
-            api_call['func_return_type'],
-            api_call['path'],
-            sample_resp)
-        generated_text = make_function(
-            func_name=api_call['gen_name'],
-            func_desc=api_call_function_comment,
-            func_args_descs=api_call['func_args'],
-            req_http_type=api_call['http_method'],
-            url_path=api_call['path']) \
-            + '\n'
-        func_file_path = public_func_dir + '/' + api_call['gen_name'] + '.ps1'
-        with open(func_file_path, 'w') as myfile:
-            print('\t- saving ' + api_call['gen_name'] + '.ps1' + ' ...')
-            myfile.write(generated_text)
+        func_filename = api_call.gen_name + '.ps1'
+        func_file_path = public_func_dir + '/' + func_filename
+        # Files of unchanged endpoints are not rewritten to keep their mtimes.
+        if manifest.is_unchanged(api_call) and os.path.isfile(func_file_path):
+            manifest.add(api_call, '', func_filename)
+            continue
+        with timings.stage('powershell.emit'):
+            generated_text = make_powershell_function(api_call,
+                                                      func_preamble, options)
+        print('\t- saving ' + func_filename + ' ...')
+        with timings.stage('powershell.write'):
+            cache.write_atomic(func_file_path, generated_text)
+        manifest.add(api_call, '', func_filename)
+    for stale_file in manifest.get_stale_files():
+        if os.path.isfile(public_func_dir + '/' + stale_file):
+            print('\t- removing ' + stale_file + ' ...')
+            os.remove(public_func_dir + '/' + stale_file)
+    if manifest.is_up_to_date():
+        print('\t- ' + module_name + '.psd1 is up to date')
+    else:
+        with timings.stage('powershell.write'):
+            ps_module.make_module_manifest(
+                [api_call.gen_name for api_call in api_calls])
+    manifest.save()
 
     print("\nPowershell module generated!")
@@ -13,19 +13,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Generate python script."""
+import concurrent.futures
+import contextlib
 import re
 import textwrap
 import os
 
-import yapf
-import pylint.lint as pylinter
-import pylint.reporters.text as textreporter
+import merakygen._cache as cache
+import merakygen._timings as timings
+import merakygen.build_manifest as bm
+import merakygen.lint as lint
+
+YAPF_STYLE = 'pep8'
+# Fewer parts than this to format are formatted without a process pool.
+MIN_PARALLEL_PARTS = 16
+# Formatted parts are evicted when older than this, or oldest first when
+# the yapf cache is bigger than this.
+YAPF_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+YAPF_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# The API key is only in this line of the runtime. The cache gets '<key>'.
+API_KEY_LINE = "'X-Cisco-Meraki-API-Key': '{}'"
 
 
 def make_function(func_name, func_desc, func_args,
-                  req_http_type, req_url_format):
-    """Generate a python function given the paramaters."""
+                  req_http_type, req_url_format, is_async=False):
+    """Generate a python function given the paramaters.
+
+    If is_async, generate a coroutine that awaits the async api_call."""
     params_should_be_in_url = req_http_type in ['GET']
+    req_scope = get_rate_limit_scope(func_args)
     if func_args:  # If there is more than the function description, +newline
         func_desc += '\n    '
     if 'params' in func_args:
@@ -34,87 +50,165 @@ def make_function(func_name, func_desc, func_args,
         if params_should_be_in_url:
             func_urlencoded_query = """         
     url_query = '?' + '&'.join([key + '=' + params[key] for key in params])"""
-            # Add additional format variable for params arg to be sent in
-            req_url_format = req_url_format.replace("\'.format", "{}\'.format")
-            assert req_url_format.count(')') <= 1  # Should only be format's )
-            req_url_format = req_url_format.replace(')', ', url_query)')
+            req_url_format = add_url_query(req_url_format)
             req_data = ''
         else:  # req_http_type in ['PUT', 'POST'], data in requests body
             func_urlencoded_query = ''
-            req_data = 'data=json.dumps(params), '
+            req_data = ', data=JSON_CODEC.dumps(params)'
     else:
         func_urlencoded_query = ''
         req_data = ''
-    function_text = """\ndef {0}({1}):
-    \"\"\"{2}\"\"\"{3}
-    response = requests.{4}(BASE_URL + {5},{6} headers=HEADERS)
+    if req_scope:
+        req_data += ', scope=' + req_scope
+    if req_http_type == 'GET':  # For per-function response cache TTLs
+        req_data += ', name=\'' + func_name + '\''
+    function_text = """\n{0}def {1}({2}):
+    \"\"\"{3}\"\"\"{4}
+    response = {5}api_call('{6}', {7}{8})
     return graceful_exit(response)""".format(
+        'async ' if is_async else '',
         func_name,
         func_args,
         func_desc,
         func_urlencoded_query,
-        req_http_type.lower(),
+        'await ' if is_async else '',
+        req_http_type,
         req_url_format,
         req_data
     )
     return function_text
 
 
-def make_classy(api_calls):
+def add_url_query(req_url_format):
+    """Add a format variable to the url for the url_query made from params."""
+    req_url_format = req_url_format.replace("\'.format", "{}\'.format")
+    assert req_url_format.count(')') <= 1  # Should only be format's )
+    if req_url_format.endswith('.format()'):  # No args in the path
+        return req_url_format.replace(')', 'url_query)')
+    return req_url_format.replace(')', ', url_query)')
+
+
+def make_iter_function(func_name, func_args, req_url_format, has_per_page,
+                       is_async=False):
+    """Generate a generator over every page of a GET function's list.
+
+    If is_async, the generator is an async generator for `async for`.
+    """
+    req_scope = get_rate_limit_scope(func_args)
+    func_urlencoded_query = ''
+    if 'params' in func_args:
+        func_args = func_args.replace('params', 'params=\'\'')
+        if has_per_page:
+            func_urlencoded_query += """
+    params = dict({'perPage': str(PER_PAGE_MAX)}, **(params or {}))"""
+        func_urlencoded_query += """
+    url_query = '?' + '&'.join([key + '=' + params[key] for key in params])"""
+        req_url_format = add_url_query(req_url_format)
+    if func_args:
+        func_args += ', '
+    per_page_desc = ''
+    if has_per_page:
+        per_page_desc = '\n    perPage defaults to PER_PAGE_MAX to ' \
+                        'fetch fewer pages.'
+    function_text = """\ndef {0}_iter({1}prefetch=False):
+    \"\"\"{2}over the items on every page of {0}().
+
+    Pages are fetched as they are needed by following the Link header.{3}
+
+    Args:
+        prefetch (bool): Fetch the next page in the background while the
+            current page is being iterated over.
+    \"\"\"{4}
+    return paginate({5}, {6}name='{0}', prefetch=prefetch)""".format(
+        func_name,
+        func_args,
+        'Asynchronously iterate ' if is_async else 'Iterate ',
+        per_page_desc,
+        func_urlencoded_query,
+        req_url_format,
+        'scope=' + req_scope + ', ' if req_scope else ''
+    )
+    return function_text
+
+
+def get_rate_limit_scope(func_args):
+    """Get the org that decides which rate limit a call counts against.
+
+    Meraki rate limits per organization. Network calls are limited with their
+    org, which get_network_org looks up in NETWORK_ORGS.
+    """
+    arg_list = func_args.split(', ')
+    if 'org_id' in arg_list:
+        return 'org_id'
+    if 'network_id' in arg_list:
+        return 'get_network_org(network_id)'
+    return ''
+
+
+def make_classy(api_calls, is_async=False):
     """Add class headers and indent all functions once.
 
-    Go through API calls and group them by section. Then add the sections
+    Go through the sections of the API calls. Then add the sections
     together into a string.
     """
-    api_sections = {}
-    generated_text = ''
-    for api_call in api_calls:
-        section_name = api_call['section'].title().replace(' ', '')
-        if section_name not in api_sections:
-            api_sections[section_name] = []
-        api_sections[section_name].append(api_call)
-
+    text_parts = []
     whitespace_between_methods = '\n'
-    for section in api_sections:
-        generated_text += """\
+    for section, section_calls in api_calls.by_section.items():
+        text_parts.append("""\
 \n\nclass {0}:
-    \"\"\"Class to access {0} functions.\"\"\"""".format(section)
+    \"\"\"Class to access {0} functions.\"\"\"""".format(
+            section.title().replace(' ', '')))
 
-        for api_call in api_sections[section]:
+        for api_call in section_calls:
             function_text = '\n@staticmethod' + make_function(
-                func_name=api_call['gen_name'],
-                func_desc=api_call['gen_func_desc'],
-                func_args=api_call['gen_func_args'],
-                req_http_type=api_call['http_method'],
-                req_url_format=api_call['gen_formatted_url'])
+                func_name=api_call.gen_name,
+                func_desc=api_call.func_desc,
+                func_args=api_call.gen_func_args,
+                req_http_type=api_call.http_method,
+                req_url_format=api_call.gen_formatted_url,
+                is_async=is_async)
             function_text += whitespace_between_methods
             # Class methods are indented one more than functions.
             indent_regex = r'\n([ ]*?[\S]+?)'  # Only indent text, not \n
-            generated_text += re.sub(indent_regex, r'\n    \1', function_text)
+            text_parts.append(
+                re.sub(indent_regex, r'\n    \1', function_text))
 
-    return generated_text
+    return ''.join(text_parts)
 
 
-def lint_output(file):
-    """Apply pylint to code text."""
-    class WritableObject:
-        # pylint: disable=too-few-public-methods
-        """Quick class to accept pylint output and write it to string."""
-        def __init__(self):
-            self.text = ''
-
-        def write(self, pylint_line):
-            """Append pylint output to list."""
-            self.text += pylint_line
-
-    pylint_output = WritableObject()
-    # Disable large file error (by design), and too few/many public methods
-    # Some classes will have 1 function and SM has 37.
-    pylinter.Run(args=[file, '--disable=C0302,R0903,R0904'],
-                 reporter=textreporter.TextReporter(pylint_output),
-                 do_exit=False)
-    if pylint_output.text and 'rated at 10.00/10' not in pylint_output.text:
-        print(pylint_output.text + 54 * '#')
+def lint_parts(output_name, text_parts):
+    """Apply pylint to each function/section of a module, reusing results."""
+    # Lint parts as files on their own so unchanged parts use cached results.
+    lint_texts = [part.rstrip('\n') + '\n' for part in text_parts]
+    runtime_names = lint.get_defined_names(lint_texts[0])
+    part_texts = lint_texts[:1] + [lint.add_runtime_import(
+        text, runtime_names) for text in lint_texts[1:]]
+    lint_args = [lint.PYLINT_CMD, lint.get_pylint_options(),
+                 lint.parse_pylint_output, lint.PYLINT_OK_CODES, '.py']
+    try:
+        part_messages = lint.lint_parts(
+            part_texts, *lint_args,
+            support_files={lint.RUNTIME_MODULE + '.py': lint_texts[0]})
+        # Then the checks across functions, like a def that replaces another.
+        lint_args[1] = lint.get_pylint_module_options()
+        module_messages = lint.lint_parts([''.join(lint_texts)],
+                                          *lint_args)[0]
+    except RuntimeError as error:
+        print('\t- could not lint {}: {}'.format(output_name, error))
+        return
+    pylint_text = ''
+    if module_messages:
+        pylint_text += '* the whole of {}\n'.format(output_name)
+        pylint_text += ''.join('  ' + msg + '\n' for msg in module_messages)
+    # The first part is the runtime, and the rest are one function each.
+    for index, (text, messages) in enumerate(zip(lint_texts, part_messages)):
+        if messages:
+            func_name = re.search(r'def (\w+)', text).group(1) if index \
+                else 'runtime'
+            pylint_text += '* {} in {}\n'.format(func_name, output_name)
+            pylint_text += ''.join('  ' + msg + '\n' for msg in messages)
+    if pylint_text:
+        print(pylint_text + 54 * '#')
         print("## Pylint check is FAILING. Please submit an issue! ##")
         print("## https://github.com/pocc/merakygen/issues     ##")
         print(54*"#")
@@ -194,9 +288,10 @@ def make_google_style_docstring(description, args, link, params,
 
 class MakePythonModule:
     """Make a folder that contains the python script and supporting files."""
-    def __init__(self, module, script_text):
+    def __init__(self, module, script_text, async_script_text=''):
         self.module_name = module
         self.script_text = script_text
+        self.async_script_text = async_script_text
 
         self.make_python_scaffolding()
         self.save_static_files()
@@ -206,8 +301,7 @@ class MakePythonModule:
         """Make the gem directory structure."""
         folders = [self.module_name]
         for folder in folders:
-            if not os.path.isdir(folder):
-                os.makedirs(folder)
+            os.makedirs(folder, exist_ok=True)
 
     def save_static_files(self):
         """Save supporting files (todo save files here)"""
@@ -215,25 +309,806 @@ class MakePythonModule:
 
     def save_script(self):
         """Save all files."""
-        filename = self.module_name + '/' + self.module_name + '.py'
-        with open(filename, 'w') as myfile:
+        if self.script_text:
+            filename = self.module_name + '/' + self.module_name + '.py'
             print('\t- saving ' + self.module_name + '...')
-            myfile.write(self.script_text)
+            cache.write_atomic(filename, self.script_text)
+        if self.async_script_text:
+            filename = self.module_name + '/' + self.module_name + '_async.py'
+            print('\t- saving ' + self.module_name + '_async...')
+            cache.write_atomic(filename, self.async_script_text)
 
 
-def make_python_script(api_key, api_calls, preamble, options):
-    """Make python script."""
-    output_file = 'meraki_api.py'
+def make_session():
+    """Generate the shared requests.Session that every function sends through.
+
+    Reusing one session keeps TCP+TLS connections to the API open between
+    calls instead of doing a new handshake for every function call.
+    """
+    return """
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 10
+SESSION = requests.Session()
+
+
+def configure_session(pool_connections=POOL_CONNECTIONS,
+                      pool_maxsize=POOL_MAXSIZE):
+    \"\"\"Mount a connection pool of the given size on the shared session.
+
+    Args:
+        pool_connections (int): Number of hosts to keep pools for.
+        pool_maxsize (int): Max connections kept alive per host. Raise this
+            if calling functions from more threads than connections.
+    \"\"\"
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                            pool_maxsize=pool_maxsize)
+    SESSION.mount('https://', adapter)
+    SESSION.mount('http://', adapter)
+
+
+configure_session()
+
+
+def send_request(http_method, url, data=None, scope=None):
+    \"\"\"Send one request, straight to the scope's shard if it is known.
+
+    Redirects are followed here, keeping the method and body, so that the
+    shard they point to is cached. A 404 from a cached shard drops it.
+    \"\"\"
+    shard_url = SHARD_CACHE.get(scope)
+    request_url = (shard_url or BASE_URL) + url
+    if url.startswith(('https://', 'http://')):  # Like Link header urls
+        shard_url, request_url = None, url
+    for _ in range(MAX_REDIRECTS + 1):
+        response = SESSION.request(http_method, request_url, data=data,
+                                   headers=HEADERS, allow_redirects=False)
+        if response.is_redirect:
+            request_url = urllib.parse.urljoin(request_url,
+                                               response.headers['Location'])
+            SHARD_CACHE.learn(scope, url, request_url)
+        elif response.status_code == 404 and shard_url:
+            SHARD_CACHE.invalidate(scope)
+            shard_url = None
+            request_url = BASE_URL + url
+        else:
+            break
+    return response
+
+
+def api_call(http_method, url, data=None, scope=None, name=None):
+    \"\"\"Send a request to BASE_URL + url through the shared session.
+
+    GETs are answered from RESPONSE_CACHE when it is enabled and fresh.
+    Waits for a token from the rate limit bucket of the scope's org first.
+    Retries while RETRY_POLICY says the response is worth retrying.
+    \"\"\"
+    if http_method == 'GET':
+        response = RESPONSE_CACHE.get(url)
+        if response is not None:
+            return response
+    attempt, waited = 0, 0
+    while True:
+        RATE_LIMITER.get_bucket(scope).acquire()
+        response = send_request(http_method, url, data, scope)
+        wait = RETRY_POLICY.get_wait(http_method, response, attempt, waited)
+        if wait is None:
+            RESPONSE_CACHE.update(http_method, url, response, name)
+            return response
+        time.sleep(wait)
+        attempt, waited = attempt + 1, waited + wait
+"""
+
+
+def make_async_client():
+    """Generate the shared httpx.AsyncClient that every coroutine awaits on.
+
+    The client is created lazily so that it binds to the running event loop.
+    """
+    return """
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+TIMEOUT = 60
+CLIENT = None
+
+
+def configure_client(max_connections=MAX_CONNECTIONS,
+                     max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                     timeout=TIMEOUT):
+    \"\"\"Replace the shared client with one using these limits.
+
+    Args:
+        max_connections (int): Max requests in flight at once.
+        max_keepalive_connections (int): Max idle connections kept open.
+        timeout (float): Seconds to wait on connect/read/write/pool.
+    Returns:
+        The new httpx.AsyncClient.
+    \"\"\"
+    global CLIENT  # pylint: disable=global-statement
+    limits = httpx.Limits(max_connections=max_connections,
+                          max_keepalive_connections=max_keepalive_connections)
+    CLIENT = httpx.AsyncClient(limits=limits, timeout=timeout,
+                               follow_redirects=False)
+    return CLIENT
+
+
+async def close_client():
+    \"\"\"Close the shared client's connections. Call before the loop ends.\"\"\"
+    global CLIENT  # pylint: disable=global-statement
+    if CLIENT is not None:
+        await CLIENT.aclose()
+        CLIENT = None
+
+
+async def send_request(http_method, url, data=None, scope=None):
+    \"\"\"Send one request, straight to the scope's shard if it is known.
+
+    Redirects are followed here, keeping the method and body, so that the
+    shard they point to is cached. A 404 from a cached shard drops it.
+    \"\"\"
+    client = CLIENT or configure_client()
+    shard_url = SHARD_CACHE.get(scope)
+    request_url = (shard_url or BASE_URL) + url
+    if url.startswith(('https://', 'http://')):  # Like Link header urls
+        shard_url, request_url = None, url
+    for _ in range(MAX_REDIRECTS + 1):
+        response = await client.request(http_method, request_url,
+                                        content=data, headers=HEADERS)
+        if response.is_redirect:
+            request_url = urllib.parse.urljoin(request_url,
+                                               response.headers['Location'])
+            SHARD_CACHE.learn(scope, url, request_url)
+        elif response.status_code == 404 and shard_url:
+            SHARD_CACHE.invalidate(scope)
+            shard_url = None
+            request_url = BASE_URL + url
+        else:
+            break
+    return response
+
+
+async def api_call(http_method, url, data=None, scope=None, name=None):
+    \"\"\"Send a request to BASE_URL + url through the shared client.
+
+    GETs are answered from RESPONSE_CACHE when it is enabled and fresh.
+    Waits for a token from the rate limit bucket of the scope's org first.
+    Retries while RETRY_POLICY says the response is worth retrying.
+    \"\"\"
+    if http_method == 'GET':
+        response = RESPONSE_CACHE.get(url)
+        if response is not None:
+            return response
+    attempt, waited = 0, 0
+    while True:
+        await RATE_LIMITER.get_bucket(scope).acquire_async()
+        response = await send_request(http_method, url, data, scope)
+        wait = RETRY_POLICY.get_wait(http_method, response, attempt, waited)
+        if wait is None:
+            RESPONSE_CACHE.update(http_method, url, response, name)
+            return response
+        await asyncio.sleep(wait)
+        attempt, waited = attempt + 1, waited + wait
+"""
+
+
+def make_rate_limiter():
+    """Generate the per-organization token bucket rate limiter.
+
+    Meraki allows 5 calls/s per org with a short burst. Calls that would go
+    over wait for a token instead of being rejected with a 429.
+    """
+    return """
+RATE_LIMIT = 5
+RATE_LIMIT_BURST = 10
+# Network => org, filled by register_networks.
+NETWORK_ORGS = {}
+
+
+class TokenBucket:
+    \"\"\"Thread-safe token bucket that paces calls to rate per second.\"\"\"
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        \"\"\"Take a token and return the seconds to wait before using it.\"\"\"
+        if not self.rate:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0, -self.tokens / self.rate)
+
+    def acquire(self):
+        \"\"\"Block the thread until a token is available.\"\"\"
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        \"\"\"Yield to the event loop until a token is available.\"\"\"
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class RateLimiter:
+    \"\"\"Hand out one token bucket per organization.\"\"\"
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_LIMIT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def configure(self, rate=RATE_LIMIT, burst=RATE_LIMIT_BURST):
+        \"\"\"Set calls per second and burst size. A rate of 0 disables.\"\"\"
+        with self.lock:
+            self.rate = rate
+            self.burst = burst
+            self.buckets = {}
+
+    def get_bucket(self, scope):
+        \"\"\"Get the bucket for an org_id (or an unregistered network_id).
+
+        Calls without an org or network share one bucket.
+        \"\"\"
+        with self.lock:
+            if scope not in self.buckets:
+                self.buckets[scope] = TokenBucket(self.rate, self.burst)
+            return self.buckets[scope]
+
+
+RATE_LIMITER = RateLimiter()
+
+
+def configure_rate_limit(rate=RATE_LIMIT, burst=RATE_LIMIT_BURST):
+    \"\"\"Set the calls per second and burst allowed for each org.
+
+    Args:
+        rate (float): Tokens added per second. 0 disables rate limiting.
+        burst (int): Max tokens an idle org can save up.
+    \"\"\"
+    RATE_LIMITER.configure(rate, burst)
+
+
+def register_networks(networks):
+    \"\"\"Rate limit calls on these networks with their organizations.
+
+    Call this before calling functions of a network. Calls on a network
+    that is not registered get a bucket of their own, so calls across the
+    networks of an org can go over its rate limit.
+
+    Args:
+        networks (list): Networks like get_networks_by_org_id(org_id) returns.
+    \"\"\"
+    for network in networks:
+        NETWORK_ORGS[network['id']] = network['organizationId']
+
+
+def get_network_org(network_id):
+    \"\"\"Get the org of a network from NETWORK_ORGS.
+
+    Warns if the network is not registered, and uses the network_id
+    instead.
+    \"\"\"
+    org_id = NETWORK_ORGS.get(network_id)
+    if org_id is None:
+        warnings.warn('Network {} is rate limited on its own. Call '
+                      'register_networks first to rate limit it with its '
+                      'organization.'.format(network_id), stacklevel=3)
+        return network_id
+    return org_id
+"""
+
+
+def make_retry_policy():
+    """Generate the retry policy that api_call consults after each response.
+
+    429 and 502/503/504 are usually transient. Retry-After is honored when
+    the API sends it; otherwise use exponential backoff with full jitter.
+    """
+    return """
+RETRY_STATUSES = (429, 502, 503, 504)
+RETRY_METHODS = ('GET', 'PUT', 'DELETE')
+MAX_RETRIES = 5
+RETRY_BUDGET = 60
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+
+
+def parse_retry_after(retry_after):
+    \"\"\"Get seconds to wait from a Retry-After header (seconds or date).\"\"\"
+    if not retry_after:
+        return None
+    try:
+        return max(0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0, retry_at.timestamp() - time.time())
+
+
+class RetryPolicy:  # pylint: disable=too-many-instance-attributes
+    \"\"\"Decide whether to retry a response and count what retries cost.\"\"\"
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.configure()
+        self.reset_stats()
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def configure(self, max_retries=MAX_RETRIES, retry_budget=RETRY_BUDGET,
+                  backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                  methods=RETRY_METHODS, statuses=RETRY_STATUSES):
+        \"\"\"Set the retry budget and which calls can be retried.\"\"\"
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.methods = tuple(methods)
+        self.statuses = tuple(statuses)
+
+    def reset_stats(self):
+        \"\"\"Zero the retry counters.\"\"\"
+        with self.lock:
+            self.stats = {'responses': 0, 'retries': 0, 'exhausted': 0,
+                          'wait_seconds': 0.0, 'by_status': {}}
+
+    def get_wait(self, http_method, response, attempt, waited):
+        \"\"\"Get the seconds to wait before retrying, or None to not retry.
+
+        Args:
+            http_method (str): GET, POST, PUT or DELETE.
+            response: The response that came back for this attempt.
+            attempt (int): Number of retries already made for this call.
+            waited (float): Seconds already spent waiting on this call.
+        \"\"\"
+        status = response.status_code
+        with self.lock:
+            self.stats['responses'] += 1
+            if status not in self.statuses or http_method not in self.methods:
+                return None
+            wait = parse_retry_after(response.headers.get('Retry-After'))
+            if wait is None:
+                ceiling = min(self.backoff_max, self.backoff_base * 2**attempt)
+                wait = random.uniform(0, ceiling)
+            if attempt >= self.max_retries or \\
+                    waited + wait > self.retry_budget:
+                self.stats['exhausted'] += 1
+                return None
+            self.stats['retries'] += 1
+            self.stats['wait_seconds'] += wait
+            by_status = self.stats['by_status']
+            by_status[status] = by_status.get(status, 0) + 1
+            return wait
+
+    def get_stats(self):
+        \"\"\"Get a copy of the retry counters.\"\"\"
+        with self.lock:
+            return dict(self.stats, by_status=dict(self.stats['by_status']))
+
+
+RETRY_POLICY = RetryPolicy()
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def configure_retries(max_retries=MAX_RETRIES, retry_budget=RETRY_BUDGET,
+                      backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                      methods=RETRY_METHODS, statuses=RETRY_STATUSES):
+    \"\"\"Set how calls are retried.
+
+    Args:
+        max_retries (int): Max retries per call. 0 disables retries.
+        retry_budget (float): Max seconds one call can spend waiting.
+        backoff_base (float): Backoff ceiling for the first retry. The
+            ceiling doubles every retry and jitter picks 0 to ceiling.
+        backoff_max (float): Largest backoff ceiling.
+        methods (tuple): HTTP methods that can be retried. POST is not
+            idempotent so it is not retried by default.
+        statuses (tuple): HTTP status codes that are retried.
+    \"\"\"
+    RETRY_POLICY.configure(max_retries, retry_budget, backoff_base,
+                           backoff_max, methods, statuses)
+
+
+def get_retry_stats():
+    \"\"\"Get counts of responses, retries, calls that ran out of retries,
+    seconds spent waiting to retry, and retries by status code.\"\"\"
+    return RETRY_POLICY.get_stats()
+"""
+
+
+def make_shard_cache():
+    """Generate the cache of which shard host serves each organization.
+
+    The API redirects org and network calls to a shard like n123.meraki.com.
+    Going straight to the shard saves a round trip on every later call.
+    """
+    return """
+MAX_REDIRECTS = 2
+SHARD_CACHE_SIZE = 1024
+SHARD_CACHE_TTL = 3600
+
+
+class ShardCache:
+    \"\"\"Bounded LRU of org -> shard base URL with entries that expire.\"\"\"
+    def __init__(self, max_size=SHARD_CACHE_SIZE, ttl=SHARD_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, scope):
+        \"\"\"Get the shard base URL for an org (or network), or None.\"\"\"
+        with self.lock:
+            if scope not in self.entries:
+                return None
+            shard_url, learned_at = self.entries[scope]
+            if time.monotonic() - learned_at > self.ttl:
+                del self.entries[scope]
+                return None
+            self.entries.move_to_end(scope)
+            return shard_url
+
+    def learn(self, scope, url, redirect_url):
+        \"\"\"Cache the shard base URL from where a call on url redirected.\"\"\"
+        api_path = url.split('?')[0]
+        redirect = urllib.parse.urlsplit(redirect_url)
+        if scope is None or not redirect.path.endswith(api_path):
+            return
+        shard_url = '{}://{}{}'.format(redirect.scheme, redirect.netloc,
+                                       redirect.path[:-len(api_path)])
+        with self.lock:
+            self.entries.pop(scope, None)
+            self.entries[scope] = (shard_url, time.monotonic())
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, scope):
+        \"\"\"Forget the shard of an org (or network).\"\"\"
+        with self.lock:
+            self.entries.pop(scope, None)
+
+
+SHARD_CACHE = ShardCache()
+"""
+
+
+def make_response_cache():
+    """Generate the opt-in cache of GET responses.
+
+    Entries expire after a per-function TTL and the least recently used are
+    evicted past an entry or byte limit. A PUT/POST/DELETE drops cached GETs
+    on the same resource path, its parents and its children.
+    """
+    return """
+CACHE_MAX_ENTRIES = 1024
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_TTL = 30
+
+
+def is_related_path(path, other_path):
+    \"\"\"Whether one path is the other or under it, like /a/b and /a/b/c.\"\"\"
+    if len(path) > len(other_path):
+        path, other_path = other_path, path
+    return other_path == path or other_path.startswith(path + '/')
+
+
+class ResponseCache:  # pylint: disable=too-many-instance-attributes
+    \"\"\"Thread-safe TTL + LRU cache of GET responses keyed by url.\"\"\"
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.stats = {}
+        self.configure()
+        self.reset_stats()
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def configure(self, enabled=False, max_entries=CACHE_MAX_ENTRIES,
+                  max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL, ttls=None):
+        \"\"\"Set the cache limits and TTLs. This also clears the cache.\"\"\"
+        with self.lock:
+            self.enabled = enabled
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self.ttl = ttl
+            self.ttls = dict(ttls or {})
+            self.entries.clear()
+            self.size = 0
+
+    def reset_stats(self):
+        \"\"\"Zero the cache counters.\"\"\"
+        with self.lock:
+            self.stats = {'hits': 0, 'misses': 0, 'expired': 0,
+                          'evictions': 0, 'invalidations': 0}
+
+    def get(self, url):
+        \"\"\"Get the cached response for url if it has not expired.\"\"\"
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            response, _, expires_at = entry
+            if time.monotonic() > expires_at:
+                self.remove(url)
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(url)
+            self.stats['hits'] += 1
+            return response
+
+    def update(self, http_method, url, response, name=None):
+        \"\"\"Cache a successful GET, or invalidate what a write changed.\"\"\"
+        if not self.enabled:
+            return
+        if http_method != 'GET':
+            self.invalidate(url)
+            return
+        ttl = self.ttls.get(name, self.ttl)
+        size = len(response.content)
+        if not 200 <= response.status_code < 300 or ttl <= 0 or \\
+                size > self.max_bytes:
+            return
+        with self.lock:
+            self.remove(url)
+            self.entries[url] = (response, size, time.monotonic() + ttl)
+            self.size += size
+            while len(self.entries) > self.max_entries or \\
+                    self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.stats['evictions'] += 1
+
+    def invalidate(self, url):
+        \"\"\"Drop cached GETs on the path of url, its parents and children.\"\"\"
+        path = url.split('?')[0].rstrip('/')
+        with self.lock:
+            for cached_url in list(self.entries):
+                if is_related_path(path, cached_url.split('?')[0]):
+                    self.remove(cached_url)
+                    self.stats['invalidations'] += 1
+
+    def remove(self, url):
+        \"\"\"Remove an entry. The lock must be held.\"\"\"
+        entry = self.entries.pop(url, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def get_stats(self):
+        \"\"\"Get a copy of the counters with the current entries and bytes.\"\"\"
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), bytes=self.size)
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def configure_cache(enabled=True, max_entries=CACHE_MAX_ENTRIES,
+                    max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL, ttls=None):
+    \"\"\"Turn the GET response cache on or off and set its limits.
+
+    Args:
+        enabled (bool): Whether GET responses are cached. Off by default.
+        max_entries (int): Max responses kept.
+        max_bytes (int): Max total size of response bodies kept.
+        ttl (float): Seconds a response stays fresh.
+        ttls (dict): Per-function seconds like
+            {'get_networks_by_org_id': 300}. 0 does not cache a function.
+    \"\"\"
+    RESPONSE_CACHE.configure(enabled, max_entries, max_bytes, ttl, ttls)
+
+
+def get_cache_stats():
+    \"\"\"Get cache hits, misses, expired, evictions, invalidations, entries
+    and bytes.\"\"\"
+    return RESPONSE_CACHE.get_stats()
+"""
+
+
+def make_paginator():
+    """Generate the paginator that the *_iter functions use.
+
+    List endpoints return one page at a time and put the url of the next
+    page in the Link header.
+    """
+    return """
+PER_PAGE_MAX = 1000
+
+
+def get_next_url(response):
+    \"\"\"Get the url of the next page from the Link header, or None.\"\"\"
+    next_link = response.links.get('next')
+    return next_link['url'] if next_link else None
+
+
+def get_page(response):
+    \"\"\"Get the list of items on a page, or raise if there is no page.\"\"\"
+    page = graceful_exit(response)
+    if isinstance(page, dict):
+        return [page]
+    if not isinstance(page, list):
+        raise ConnectionError('Could not get page, status: ' + str(page))
+    return page
+"""
+
+
+def make_sync_paginator():
+    """Generate the paginate generator for the requests module."""
+    return """
+
+def paginate(url, scope=None, name=None, prefetch=False):
+    \"\"\"Yield the items of every page, starting with BASE_URL + url.
+
+    With prefetch, the next page is requested on a background thread while
+    the items of the current page are yielded.
+    \"\"\"
+    executor = None
+    if prefetch:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    try:
+        response = api_call('GET', url, scope=scope, name=name)
+        while True:
+            next_url = get_next_url(response)
+            pending = None
+            if executor and next_url:
+                pending = executor.submit(api_call, 'GET', next_url,
+                                          scope=scope, name=name)
+            yield from get_page(response)
+            if not next_url:
+                return
+            if pending:
+                response = pending.result()
+            else:
+                response = api_call('GET', next_url, scope=scope, name=name)
+    finally:
+        if executor:
+            executor.shutdown(wait=False)
+"""
+
+
+def make_async_paginator():
+    """Generate the paginate async generator for the httpx module."""
+    return """
+
+async def paginate(url, scope=None, name=None, prefetch=False):
+    \"\"\"Yield the items of every page, starting with BASE_URL + url.
+
+    With prefetch, the next page is requested in a task while the items of
+    the current page are yielded.
+    \"\"\"
+    pending = None
+    try:
+        response = await api_call('GET', url, scope=scope, name=name)
+        while True:
+            next_url = get_next_url(response)
+            if prefetch and next_url:
+                pending = asyncio.ensure_future(
+                    api_call('GET', next_url, scope=scope, name=name))
+            for item in get_page(response):
+                yield item
+            if not next_url:
+                return
+            if pending:
+                response, pending = await pending, None
+            else:
+                response = await api_call('GET', next_url, scope=scope,
+                                          name=name)
+    finally:
+        if pending:
+            pending.cancel()
+"""
+
+
+def make_json_codec():
+    """Generate the JSON codec used for responses and request bodies.
+
+    orjson and ujson are much faster than json on big lists of clients and
+    devices. They are used if installed and parse the response bytes as is.
+    """
+    return """
+try:
+    import orjson
+except ImportError:
+    orjson = None  # pylint: disable=invalid-name
+try:
+    import ujson
+except ImportError:
+    ujson = None  # pylint: disable=invalid-name
+
+JSON_BACKENDS = collections.OrderedDict([
+    (backend.__name__, backend) for backend in [orjson, ujson, json] if backend
+])
+
+
+class JsonCodec:
+    \"\"\"Decode and encode JSON with one of JSON_BACKENDS.\"\"\"
+    def __init__(self, backend=None):
+        self.name = None
+        self.loads = None
+        self.dumps = None
+        self.use(backend)
+
+    def use(self, backend=None):
+        \"\"\"Switch to a backend by name. The default is the fastest one.\"\"\"
+        self.name = backend or next(iter(JSON_BACKENDS))
+        if self.name not in JSON_BACKENDS:
+            raise ValueError(self.name + ' is not installed. Installed: ' +
+                             ', '.join(JSON_BACKENDS))
+        self.loads = JSON_BACKENDS[self.name].loads
+        self.dumps = JSON_BACKENDS[self.name].dumps
+
+
+JSON_CODEC = JsonCodec()
+
+
+def set_json_backend(backend=None):
+    \"\"\"Use 'orjson', 'ujson' or 'json' for responses and request bodies.
+
+    Args:
+        backend (str): Name of an installed backend. The default is the
+            fastest one installed.
+    \"\"\"
+    JSON_CODEC.use(backend)
+"""
+
+
+def make_python_text(api_key, api_calls, preamble, options, is_async=False,
+                     manifest=None):
+    """Get the text of the python script.
+
+    If is_async, the functions are coroutines on httpx instead of requests.
+    If a build manifest is given, functions of endpoints that have not
+    changed since the last run are reused instead of rendered again.
+    """
+    return ''.join(make_python_parts(api_key, api_calls, preamble, options,
+                                     is_async, manifest))
+
+
+def make_runtime(api_key, is_async=False):
+    """Get the imports, settings and helpers that every function uses."""
+    std_modules = ['asyncio', 'collections', 'email.utils', 'json', 'random',
+                   'threading', 'time', 'urllib.parse', 'warnings']
+    if not is_async:  # Thread to prefetch pages
+        std_modules.insert(2, 'concurrent.futures')
+    std_imports = ''.join('import ' + module + '\n' for module in std_modules)
+    if is_async:
+        http_imports = 'import httpx\n'
+    else:
+        http_imports = 'import requests\nimport requests.adapters\n'
     generated_text = """\
-# -*- coding: utf-8 -*-
-\"\"\"{}\"\"\"
-import json\n\nimport requests\n
+{}\n{}
 BASE_URL = 'https://api.meraki.com/api/v0'
 HEADERS = {{
-    'X-Cisco-Meraki-API-Key': '{}',
+    {},
     'Content-Type': 'application/json'
 }}
-
+""".format(std_imports, http_imports, API_KEY_LINE.format(api_key))
+    generated_text += make_json_codec()
+    generated_text += make_rate_limiter()
+    generated_text += make_retry_policy()
+    generated_text += make_shard_cache()
+    generated_text += make_response_cache()
+    generated_text += make_paginator()
+    if is_async:
+        generated_text += make_async_client()
+        generated_text += make_async_paginator()
+    else:
+        generated_text += make_session()
+        generated_text += make_sync_paginator()
+    generated_text += """
 
 def graceful_exit(response):
     \"\"\"Gracefully exit from the function.
@@ -242,7 +1117,7 @@ def graceful_exit(response):
         200: Successful GET, UPDATE
         201: Successful POST
     
-    {{}}:
+    {}:
         204: Successful DELETE
         400: Bad request. Correct/check your params
         404: Resource not found. Correct/check your params
@@ -254,7 +1129,7 @@ def graceful_exit(response):
         JSON if one is available. Return status code (int) if not.
     \"\"\"
     try:
-        resp_json = json.loads(response.text)
+        resp_json = JSON_CODEC.loads(response.content)
         if 'errors' in resp_json:
             raise ConnectionError(resp_json['errors'])
         if type(resp_json) == json:
@@ -263,38 +1138,173 @@ def graceful_exit(response):
     except ValueError:
         return response.status_code
 
-""".format(preamble, api_key)
+"""
+    return generated_text
+
+
+def get_runtime_names():
+    """Get the names that the runtime (of either module) defines, which no
+    generated function can have."""
+    return frozenset().union(*(
+        lint.get_defined_names(make_runtime('<key>', is_async))
+        for is_async in [False, True]))
+
+
+def make_python_parts(api_key, api_calls, preamble, options, is_async=False,
+                      manifest=None):
+    """Get the text of the python script as [header, runtime, functions...].
+
+    Each part can be formatted on its own. See make_python_text for args.
+    """
+    generated_text = make_runtime(api_key, is_async)
+    if manifest:
+        manifest.add_section('runtime', generated_text)
+    # Functions are joined once by the caller instead of copying the whole
+    # text for each one.
+    header = '# -*- coding: utf-8 -*-\n"""{}"""\n'.format(preamble)
+    text_parts = [header, generated_text]
     if 'classy' in options:
-        generated_text += make_classy(api_calls)
+        text_parts.append(make_classy(api_calls, is_async))
     else:
         whitespace_between_functions = '\n\n'
         sample_resp = ''
         for api_call in api_calls:
+            function_text = manifest.get_text(api_call) if manifest else None
+            if function_text is not None:
+                text_parts.append(function_text)
+                manifest.add(api_call, function_text)
+                continue
             if '--sample-resp' in options:
-                sample_resp = api_call['sample_resp']
+                sample_resp = api_call.sample_resp
             api_call_func_desc = make_google_style_docstring(
-                api_call['func_desc'],
-                api_call['func_args'],
-                api_call['func_link'],
-                api_call['func_params'],
-                api_call['func_return_type'],
+                api_call.func_desc,
+                api_call.func_args,
+                api_call.func_link,
+                api_call.func_params,
+                api_call.func_return_type,
                 sample_resp)
-            generated_text += make_function(
-                func_name=api_call['gen_name'],
+            function_text = make_function(
+                func_name=api_call.gen_name,
                 func_desc=api_call_func_desc,
-                func_args=api_call['gen_func_args'],
-                req_http_type=api_call['http_method'],
-                req_url_format=api_call['gen_formatted_url']) \
+                func_args=api_call.gen_func_args,
+                req_http_type=api_call.http_method,
+                req_url_format=api_call.gen_formatted_url,
+                is_async=is_async) \
                 + whitespace_between_functions
-    MakePythonModule('pacg_meraki', generated_text)
-    if '--textwrap' in options:
-        print('\t- text wrapping ' + output_file + '...')
-        yapf.yapf_api.FormatFile(
-            filename=output_file,
-            in_place=True,
-            style_config='pep8',
-            verify=True)
-    if '--lint' in options:
-        print('\t- linting ' + output_file + '...')
-        lint_output(output_file)
+            if api_call.http_method == 'GET' and \
+                    api_call.func_return_type == 'list':
+                function_text += make_iter_function(
+                    func_name=api_call.gen_name,
+                    func_args=api_call.gen_func_args,
+                    req_url_format=api_call.gen_formatted_url,
+                    has_per_page='perPage' in api_call.func_params,
+                    is_async=is_async) \
+                    + whitespace_between_functions
+            text_parts.append(function_text)
+            if manifest:
+                manifest.add(api_call, function_text)
+    return text_parts
+
+
+def format_python_part(text):
+    """Format python code with yapf (pep8), keeping the newlines around it."""
+    from yapf.yapflib import yapf_api  # pylint: disable=C0415
+    leading_newlines = text[:len(text) - len(text.lstrip('\n'))]
+    formatted_text = yapf_api.FormatCode(text, style_config=YAPF_STYLE)[0]
+    return leading_newlines + formatted_text + '\n'
+
+
+def format_python_parts(text_parts, api_key='<key>'):
+    """Format each part of the python text with yapf.
+
+    Parts are formatted in memory, independently of each other, and
+    cached by the hash of their text. Parts not in the cache are fanned out
+    across a process pool, so unchanged functions are never formatted again.
+    The runtime is formatted and cached with '<key>' instead of api_key, so
+    the key is never saved to the cache.
+    """
+    import yapf  # pylint: disable=import-outside-toplevel
+    key_line, placeholder_line = [API_KEY_LINE.format(key)
+                                  for key in [api_key, '<key>']]
+    text_parts = [text.replace(key_line, placeholder_line)
+                  for text in text_parts]
+    cache_dir = cache.get_cache_dir('yapf')
+    key_prefix = yapf.__version__ + YAPF_STYLE
+    formatted_parts = list(text_parts)
+    uncached = {}  # Cache file of a part => indexes of parts with its text
+    for index, text in enumerate(text_parts):
+        cache_file = os.path.join(
+            cache_dir, cache.get_hash(key_prefix + text) + '.py')
+        try:
+            with open(cache_file, encoding='utf-8') as file_obj:
+                formatted_parts[index] = file_obj.read()
+        except OSError:
+            uncached.setdefault(cache_file, []).append(index)
+            continue
+        with contextlib.suppress(OSError):  # Used parts are evicted last.
+            os.utime(cache_file)
+    if uncached:
+        format_uncached_parts(text_parts, formatted_parts, uncached)
+        cache.evict_files(cache_dir, YAPF_CACHE_MAX_AGE, YAPF_CACHE_MAX_BYTES)
+    return [text.replace(placeholder_line, key_line)
+            for text in formatted_parts]
+
+
+def format_uncached_parts(text_parts, formatted_parts, uncached):
+    """Format and cache the parts that are not in the cache yet."""
+    cache_files = list(uncached)
+    texts = [text_parts[uncached[cache_file][0]] for cache_file in cache_files]
+    if len(texts) < MIN_PARALLEL_PARTS:  # Not worth starting processes
+        results = [format_python_part(text) for text in texts]
+    else:
+        with concurrent.futures.ProcessPoolExecutor() as pool:
+            results = list(pool.map(format_python_part, texts, chunksize=8))
+    for cache_file, formatted_text in zip(cache_files, results):
+        cache.write_atomic(cache_file, formatted_text)
+        for index in uncached[cache_file]:
+            formatted_parts[index] = formatted_text
+
+
+def make_python_script(api_key, api_calls, preamble, options):
+    """Make python script."""
+    module_name = 'pacg_meraki'
+    output_names = [module_name]
+    if '--async' in options:
+        output_names.append(module_name + '_async')
+    manifests, scripts = [], []
+    for output_name in output_names:
+        manifest = bm.BuildManifest(module_name, output_name + '.py',
+                                    'python', options)
+        manifests.append(manifest)
+        with timings.stage('python.emit'):
+            text_parts = make_python_parts(
+                api_key, api_calls, preamble, options,
+                is_async=output_name.endswith('_async'), manifest=manifest)
+        # Leave modules alone if none of their endpoints changed since last run.
+        is_up_to_date = manifest.is_up_to_date()
+        if is_up_to_date:
+            print('\t- ' + output_name + ' is up to date')
+        # Up to date modules are only formatted (from cache) to lint them.
+        needs_text = not is_up_to_date or '--lint' in options
+        if '--textwrap' in options and needs_text:
+            if not is_up_to_date:
+                print('\t- text wrapping ' + output_name + '...')
+            # The header has the preamble, which changes every run.
+            with timings.stage('python.format'):
+                text_parts[1:] = format_python_parts(text_parts[1:],
+                                                     api_key)
+            formatted_text = ''.join(text_parts[1:])
+            script_text = text_parts[0] + formatted_text.rstrip('\n') + '\n'
+        else:
+            script_text = ''.join(text_parts)
+        scripts.append('' if is_up_to_date else script_text)
+        if '--lint' in options:
+            print('\t- linting ' + output_name + '...')
+            with timings.stage('python.lint'):
+                lint_parts(output_name, text_parts[1:])
+    with timings.stage('python.write'):
+        async_script_text = scripts[1] if len(scripts) > 1 else ''
+        MakePythonModule(module_name, scripts[0], async_script_text)
+        for manifest in manifests:
+            manifest.save()
     print("\nPython module generated!")
@@ -14,9 +14,15 @@
 # limitations under the License.
 """Generate ruby script."""
 import re
+import shutil
 import textwrap
 import os
 
+import merakygen._cache as cache
+import merakygen._timings as timings
+import merakygen.build_manifest as bm
+import merakygen.lint as lint
+
 
 def make_ruby_function(func_name, func_desc, func_args,
                        req_http_type, req_path):
@@ -157,20 +163,49 @@ class MakeRubyGem:
         """Make the gem directory structure."""
         folders = [self.gem_name]
         for folder in folders:
-            if not os.path.isdir(folder):
-                os.makedirs(folder)
+            os.makedirs(folder, exist_ok=True)
 
     def save_static_files(self):
         """Save supporting files like .rubocop.yml."""
         rubocop_text = """AllCops:\n  TargetRubyVersion: 2.3.3"""
-        with open(self.gem_name + '/.rubocop.yml', 'w') as myfile:
-            myfile.write(rubocop_text)
+        bm.write_if_changed(self.gem_name + '/.rubocop.yml', rubocop_text)
 
     def save_script(self):
         """Save all files."""
-        with open(self.gem_name + '/' + self.gem_name + '.rb', 'w') as myfile:
-            print('\t- saving ' + self.gem_name + '...')
-            myfile.write(self.script_text)
+        if not self.script_text:
+            return
+        print('\t- saving ' + self.gem_name + '...')
+        cache.write_atomic(self.gem_name + '/' + self.gem_name + '.rb',
+                           self.script_text)
+
+
+def lint_parts(gem_name, text_parts):
+    """Apply rubocop to each function/section of a gem, reusing results."""
+    if not shutil.which(lint.RUBOCOP_CMD[0]):
+        print('\t- rubocop not found, skipping lint of ' + gem_name)
+        return
+    print('\t- linting ' + gem_name + '...')
+    config_file = gem_name + '/.rubocop.yml'
+    with open(config_file, encoding='utf-8') as file_obj:
+        config_text = file_obj.read()
+    try:
+        part_messages = lint.lint_parts(
+            text_parts, lint.RUBOCOP_CMD, lint.get_rubocop_options(config_file),
+            lint.parse_rubocop_output, lint.RUBOCOP_OK_CODES, '.rb',
+            config_text)
+    except RuntimeError as error:
+        print('\t- could not lint {}: {}'.format(gem_name, error))
+        return
+    rubocop_text = ''
+    # The first part is the runtime, and the rest are one function each.
+    for index, (text, messages) in enumerate(zip(text_parts, part_messages)):
+        if messages:
+            func_name = re.search(r'def (\w+)', text).group(1) if index \
+                else 'runtime'
+            rubocop_text += '* {} in {}\n'.format(func_name, gem_name)
+            rubocop_text += ''.join('  ' + msg + '\n' for msg in messages)
+    if rubocop_text:
+        print(rubocop_text + 'Rubocop check is FAILING.')
 
 
 def make_ruby_script(api_key, api_calls, preamble, options):
@@ -178,22 +213,55 @@ def make_ruby_script(api_key, api_calls, preamble, options):
     # Indent preamble heredoc exactly 2 spaces
     preamble = '  ' + re.sub(r'\n[ ]*', '\n  ', preamble)
     gem_name = 'pacg_meraki'
+    manifest = bm.BuildManifest(gem_name, gem_name + '.rb', 'ruby', options)
     generated_text = """\
-<<~HEREDOC
-{}
-HEREDOC
-
 require 'net/http'
 require 'uri'
 require 'json'
 
 $base_url = 'https://api.meraki.com/api/v0'
 
+# Org/network calls get redirected to a shard host like n123.meraki.com.
+# Remember the shard so later calls skip the redirect.
+SHARD_CACHE_SIZE = 1024
+SHARD_CACHE_TTL = 3600
+$shard_cache = {{}}
+
+# The '/organizations/[id]' or '/networks/[id]' that a url belongs to.
+def shard_key(url)
+  match = %r{{/(organizations|networks)/[^/?]+}}.match(URI.parse(url).path)
+  match && match[0]
+end
+
+# Swap $base_url for the cached shard of the url's org/network, if any.
+def shard_url(url)
+  key = shard_key(url)
+  entry = $shard_cache.delete(key)
+  return url if entry.nil? || Time.now - entry[:learned_at] > SHARD_CACHE_TTL
+
+  $shard_cache[key] = entry # Reinsert as most recently used.
+  url.sub($base_url, entry[:base_url])
+end
+
+# Cache the shard base url from where a call on url was redirected.
+def learn_shard(url, location)
+  key = shard_key(url)
+  api_path = URI.parse(url).path.sub(URI.parse($base_url).path, '')
+  shard = URI.parse(location)
+  return if key.nil? || !shard.path.end_with?(api_path)
+
+  $shard_cache.delete(key)
+  $shard_cache.shift while $shard_cache.size >= SHARD_CACHE_SIZE
+  base_url = "#{{shard.scheme}}://#{{shard.host}}#{{shard.path.chomp(api_path)}}"
+  $shard_cache[key] = {{ base_url: base_url, learned_at: Time.now }}
+end
+
 # From Ruby docs. One redirect is expected: a second is not.
 def api_call(http_method, url, options, limit = 2)
   raise ArgumentError, 'too many HTTP redirects' if limit.zero?
 
-  uri = URI.parse(url)
+  request_url = shard_url(url)
+  uri = URI.parse(request_url)
   http = Net::HTTP.new(uri.host, uri.port)
   http.use_ssl = true
 
@@ -220,33 +288,63 @@ def api_call(http_method, url, options, limit = 2)
   when Net::HTTPSuccess then
     response.body
   when Net::HTTPRedirection then
+    learn_shard(url, response['location'])
     api_call(http_method, response['location'], options, limit - 1)
+  when Net::HTTPNotFound then
+    return response.value if request_url == url
+
+    # The cached shard is stale. Ask $base_url again.
+    $shard_cache.delete(shard_key(url))
+    api_call(http_method, url, options, limit)
   else
     response.value
   end
 end
 
-""".format(preamble, api_key)
+""".format(api_key)
+    manifest.add_section('runtime', generated_text)
+    # Functions are joined once at the end instead of copying the whole
+    # text for each one.
+    text_parts = ['', generated_text]  # The preamble goes first if saved.
     if options:
         print("WARNING: Ruby options currently won't do anything.")
-    whitespace_between_functions = '\n\n'
-    sample_resp = ''
-    for api_call in api_calls:
-        if '--sample-resp' in options:
-            sample_resp = api_call['sample_resp']
-        api_call_func_desc = make_yard_docstring(
-                api_call['func_desc'],
-                api_call['func_args'],
-                api_call['func_link'],
-                api_call['func_params'],
-                api_call['func_return_type'],
-                sample_resp)
-        generated_text += make_ruby_function(
-            func_name=api_call['gen_name'],
-            func_desc=api_call_func_desc,
-            func_args=api_call['gen_func_args'],
-            req_http_type=api_call['http_method'],
-            req_path=api_call['path']) \
-            + whitespace_between_functions
-    MakeRubyGem(gem='pacg_meraki', script_text=generated_text)
+    with timings.stage('ruby.emit'):
+        whitespace_between_functions = '\n\n'
+        sample_resp = ''
+        for api_call in api_calls:
+            function_text = manifest.get_text(api_call)
+            if function_text is not None:  # Unchanged since last run
+                text_parts.append(function_text)
+                manifest.add(api_call, function_text)
+                continue
+            if '--sample-resp' in options:
+                sample_resp = api_call.sample_resp
+            api_call_func_desc = make_yard_docstring(
+                    api_call.func_desc,
+                    api_call.func_args,
+                    api_call.func_link,
+                    api_call.func_params,
+                    api_call.func_return_type,
+                    sample_resp)
+            function_text = make_ruby_function(
+                func_name=api_call.gen_name,
+                func_desc=api_call_func_desc,
+                func_args=api_call.gen_func_args,
+                req_http_type=api_call.http_method,
+                req_path=api_call.path) \
+                + whitespace_between_functions
+            text_parts.append(function_text)
+            manifest.add(api_call, function_text)
+    if manifest.is_up_to_date():
+        print('\t- ' + gem_name + ' is up to date')
+        generated_text = ''
+    else:
+        text_parts[0] = '<<~HEREDOC\n{}\nHEREDOC\n\n'.format(preamble)
+        generated_text = ''.join(text_parts)
+    with timings.stage('ruby.write'):
+        MakeRubyGem(gem=gem_name, script_text=generated_text)
+        manifest.save()
+    if '--lint' in options:
+        with timings.stage('ruby.lint'):
+            lint_parts(gem_name, text_parts[1:])
     print("\nRuby module generated!")
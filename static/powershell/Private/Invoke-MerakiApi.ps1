@@ -1,4 +1,51 @@
 # Funtion that interacts with the Meraki API
+$script:BaseUrl = "https://api.meraki.com/api/v0"
+
+# Org/network calls get redirected to a shard host like n123.meraki.com.
+# Remember the shard so later calls skip the redirect.
+$script:ShardCache = @{}
+$script:ShardCacheSize = 1024
+$script:ShardCacheTtl = New-TimeSpan -Hours 1
+
+function Get-ShardKey([string]$endpointUrl) {
+    # The '/organizations/[id]' or '/networks/[id]' that a url belongs to.
+    if ($endpointUrl -match '^/(organizations|networks)/[^/?]+') {
+        return $Matches[0]
+    }
+    return $null
+}
+
+function Get-ShardUrl([string]$shardKey) {
+    # Get the cached shard base url for an org/network, or the default.
+    if ($shardKey -and $script:ShardCache.ContainsKey($shardKey)) {
+        $entry = $script:ShardCache[$shardKey]
+        if (((Get-Date) - $entry.LearnedAt) -lt $script:ShardCacheTtl) {
+            return $entry.BaseUrl
+        }
+        $script:ShardCache.Remove($shardKey)
+    }
+    return $script:BaseUrl
+}
+
+function Set-ShardUrl([string]$shardKey, [string]$endpointUrl, [Uri]$responseUri) {
+    # Cache the shard base url from the url that finally answered the call.
+    $apiPath = $endpointUrl.Split('?')[0]
+    $path = $responseUri.AbsolutePath
+    if (-not $shardKey -or -not $path.EndsWith($apiPath)) {
+        return
+    }
+    $shardUrl = "$($responseUri.Scheme)://$($responseUri.Authority)" + `
+                $path.Substring(0, $path.Length - $apiPath.Length)
+    if ($shardUrl -eq $script:BaseUrl) {
+        return
+    }
+    if ($script:ShardCache.Count -ge $script:ShardCacheSize) {
+        $oldest = $script:ShardCache.GetEnumerator() | Sort-Object { $_.Value.LearnedAt } | Select-Object -First 1
+        $script:ShardCache.Remove($oldest.Key)
+    }
+    $script:ShardCache[$shardKey] = @{ BaseUrl = $shardUrl; LearnedAt = Get-Date }
+}
+
 function Invoke-ApiCall ([string]$httpMethod, [string]$endpointUrl, [string]$params) {
     # Gather/Format API call inputs for Send Request and then call
     # Using Invoke-WebRequest over Invoke-RestMethod because the former has more
@@ -6,7 +53,9 @@ function Invoke-ApiCall ([string]$httpMethod, [string]$endpointUrl, [string]$par
     [string] $apiKey = "{}"
     [hashtable] $headers = @{ 'X-Cisco-Meraki-API-Key' = $apiKey }
     Print("`nCalling $($httpMethod) on $($endpointUrl) with [$($params)] params.")
-    $url = "https://api.meraki.com/api/v0$($endpointUrl)"
+    $shardKey = Get-ShardKey $endpointUrl
+    $baseUrl = Get-ShardUrl $shardKey
+    $url = "$($baseUrl)$($endpointUrl)"
     $RespErr = ''
 
     try {
@@ -22,6 +71,16 @@ function Invoke-ApiCall ([string]$httpMethod, [string]$endpointUrl, [string]$par
         # Keeping for troubleshooting purposes
         $statusCode = $result.StatusCode
 
+        # Redirects are followed for us. Learn the shard from where they ended.
+        # Powershell 5 has ResponseUri, Powershell 6+ has RequestMessage.
+        $responseUri = $result.BaseResponse.ResponseUri
+        if (-not $responseUri) {
+            $responseUri = $result.BaseResponse.RequestMessage.RequestUri
+        }
+        if ($responseUri) {
+            Set-ShardUrl $shardKey $endpointUrl $responseUri
+        }
+
         # Get data and remove trailing whitespace
         $data = $result.Content -replace "[\s]*$",""
         return $data
@@ -29,7 +88,12 @@ function Invoke-ApiCall ([string]$httpMethod, [string]$endpointUrl, [string]$par
     catch {
         $data = $RespErr
         $statusCode = $_.Exception.Response.StatusCode.Value__
+        if ($statusCode -eq 404 -and $baseUrl -ne $script:BaseUrl) {
+            # The cached shard is stale. Ask the default base url again.
+            $script:ShardCache.Remove($shardKey)
+            return Invoke-ApiCall $httpMethod $endpointUrl $params
+        }
         Print("Status code: $($statusCode); Data: $($data)")
         return $data
     }
-}
\ No newline at end of file
+}
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark each stage of the generator and each emitter as specs grow.
+
+Run from the tests folder:
+`PYTHONPATH=.. python -m benchmarks.bench_generator [results.json] [sizes...]`
+
+Stages are timed on static/api.json and on synthetic specs (fuzz_spec with
+its fixed seed) of each size (1k, 10k and 50k endpoints by default). Results are written as JSON to
+compare runs. Between sizes, each stage gets a scaling exponent (1 is
+linear), and stages above SUPERLINEAR_EXPONENT are reported. A stage is
+skipped if it would take more than MAX_STAGE_SECONDS at the current size.
+"""
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import unittest.mock
+
+import merakygen
+import merakygen.create_function_docstring as docs
+import merakygen.create_method as make_method
+import merakygen.make_bash_script as mbs
+import merakygen.make_powershell_module as mpss
+import merakygen.make_python_script as mps
+import merakygen.make_ruby_script as mrs
+from tests.benchmarks.bench_import_time import REPO_DIR
+from tests.benchmarks.synthetic_spec import fuzz_spec, load_spec
+
+SIZES = [1000, 10000, 50000]
+SUPERLINEAR_EXPONENT = 1.25
+MAX_STAGE_SECONDS = 120
+EMITTERS = {
+    'python': mps.make_python_script,
+    'ruby': mrs.make_ruby_script,
+    'bash': mbs.make_bash_script,
+    'powershell': mpss.make_powershell_script,
+}
+
+
+def render_python_docstring(api_call):
+    """Render the docstring like make_python_parts does."""
+    return mps.make_google_style_docstring(
+        api_call.func_desc, api_call.func_args, api_call.func_link,
+        api_call.func_params, api_call.func_return_type, '')
+
+
+def render_ruby_docstring(api_call):
+    """Render the docstring like make_ruby_script does."""
+    return mrs.make_yard_docstring(
+        api_call.func_desc, api_call.func_args, api_call.func_link,
+        api_call.func_params, api_call.func_return_type, '')
+
+
+def render_powershell_docstring(api_call):
+    """Render the comment-based help like make_powershell_function does."""
+    return mpss.make_function_comment(
+        'Benchmark', api_call.func_desc, api_call.func_args,
+        api_call.func_link, api_call.func_params,
+        api_call.func_return_type, api_call.path, '')
+
+
+DOCSTRING_RENDERERS = {
+    'python': render_python_docstring,
+    'ruby': render_ruby_docstring,
+    'powershell': render_powershell_docstring,
+}
+
+
+def get_stages(spec_text):
+    """Get [(stage name, func), ...] in pipeline order for a spec.
+
+    Each func is called with the API calls from the stages before it.
+    The stages after get_function_docstring only read them.
+    """
+    def get_function_docstrings(api_calls):
+        """Time get_function_docstring apart from the rest of modify."""
+        for api_call in api_calls:
+            has_params = bool(api_call.params)
+            func_args = make_method.get_path_args(api_call.path, has_params)
+            docs.get_function_docstring(api_call, func_args)
+        return api_calls
+
+    stages = [
+        ('load_spec', lambda _: json.loads(spec_text)),
+        ('modify_api_calls',
+         lambda api_json: make_method.modify_api_calls(api_json, [], 'python')),
+        ('get_function_docstring', get_function_docstrings),
+    ]
+    stages.append(('resolve_name_collisions',
+                   make_method.resolve_name_collisions))
+    stages.append(('truncate_func_name', lambda api_calls: (
+        mpss.truncate_func_name(
+            make_method.set_func_names(api_calls, 'powershell')))))
+    for language, renderer in DOCSTRING_RENDERERS.items():
+        stages.append(('docstrings.' + language,
+                       lambda api_calls, renderer=renderer: [
+                           renderer(api_call) for api_call in api_calls]))
+    for language, emitter in EMITTERS.items():
+        stages.append(('make_script.' + language,
+                       lambda api_calls, language=language, emitter=emitter:
+                       run_emitter(emitter, api_calls, language)))
+    return stages
+
+
+# Stages that later ones do not depend on, so they can be skipped.
+READ_ONLY_STAGES = [stage for stage, _ in get_stages('')[3:]]
+
+
+def run_emitter(emitter, api_calls, language):
+    """Generate a language in a scratch dir, as a first run would."""
+    api_calls = make_method.set_func_names(api_calls, language)
+    preamble = make_method.get_preamble(
+        [], len(api_calls), make_method.get_http_stats(api_calls), language)
+    old_cwd = os.getcwd()
+    # Powershell copies static files from ../static, so stay in the repo.
+    temp_dir = tempfile.mkdtemp(dir=REPO_DIR)
+    os.chdir(temp_dir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            emitter('<key>', api_calls, preamble, [])
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(temp_dir)
+    return api_calls
+
+
+def get_exponent(old_result, new_result):
+    """Get k of time ~ endpoints^k between two sizes (1 is linear)."""
+    if not old_result.get('seconds') or not new_result.get('seconds'):
+        return None
+    return math.log(new_result['seconds'] / old_result['seconds']) / \
+        math.log(new_result['endpoints'] / old_result['endpoints'])
+
+
+def bench_spec(name, api_json, last_results=None):
+    """Time every stage on a spec and get {stage: result}."""
+    spec_text = json.dumps(api_json)
+    num_endpoints = sum(len(api_calls) for api_calls in api_json.values())
+    print('{} ({} endpoints)'.format(name, num_endpoints))
+    results = {}
+    value = None
+    for stage, func in get_stages(spec_text):
+        last_result = (last_results or {}).get(stage, {})
+        if last_result.get('seconds') and stage in READ_ONLY_STAGES:
+            exponent = max(1, last_result.get('exponent') or 1)
+            projected = last_result['seconds'] * (
+                num_endpoints / last_result['endpoints']) ** exponent
+            if projected > MAX_STAGE_SECONDS:
+                results[stage] = {'endpoints': num_endpoints,
+                                  'skipped': True, 'projected': projected}
+                print('  {:28} skipped (~{:.0f}s projected)'.format(
+                    stage, projected))
+                continue
+        start = time.perf_counter()
+        new_value = func(value)
+        seconds = time.perf_counter() - start
+        if stage not in READ_ONLY_STAGES:
+            value = new_value
+        results[stage] = {'endpoints': num_endpoints, 'seconds': seconds,
+                          'us_per_endpoint': seconds / num_endpoints * 1e6}
+        if last_result.get('seconds'):
+            results[stage]['exponent'] = get_exponent(last_result,
+                                                      results[stage])
+        print('  {:28} {:9.3f}s {:9.1f}µs/endpoint{}'.format(
+            stage, seconds, results[stage]['us_per_endpoint'],
+            get_scaling_note(results[stage])))
+    return results
+
+
+def get_scaling_note(result):
+    """Get the note to print after a stage's time about its scaling."""
+    exponent = result.get('exponent')
+    if exponent is None:
+        return ''
+    note = '  x^{:.2f}'.format(exponent)
+    if exponent > SUPERLINEAR_EXPONENT:
+        note += '  SUPERLINEAR'
+    return note
+
+
+def main(output_file='bench_generator.json', sizes=None):
+    """Benchmark static/api.json and synthetic specs and save the results."""
+    sizes = sizes or SIZES
+    cache_dir = tempfile.mkdtemp()
+    results = {
+        'date': datetime.datetime.now().isoformat(),
+        'merakygen_version': merakygen.__version__,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'specs': {},
+    }
+    # Keep the emitters' caches (like formatted code) out of the user's.
+    with unittest.mock.patch.dict(os.environ,
+                                  {'MERAKYGEN_CACHE_DIR': cache_dir}):
+        api_json = load_spec()
+        results['specs']['static/api.json'] = bench_spec('static/api.json',
+                                                         api_json)
+        last_results = None
+        for size in sizes:
+            name = 'synthetic-{}'.format(size)
+            last_results = bench_spec(name, fuzz_spec(api_json, size),
+                                      last_results)
+            results['specs'][name] = last_results
+    shutil.rmtree(cache_dir)
+    superlinear = sorted({
+        stage for spec in results['specs'].values()
+        for stage, result in spec.items()
+        if (result.get('exponent') or 0) > SUPERLINEAR_EXPONENT})
+    results['superlinear_stages'] = superlinear
+    with open(output_file, 'w', encoding='utf-8') as file_obj:
+        json.dump(results, file_obj, indent=2, sort_keys=True)
+    print('Results saved to ' + output_file)
+    if superlinear:
+        print('Superlinear stages: ' + ', '.join(superlinear))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], sizes=[int(size) for size in sys.argv[2:]])
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark how long the CLI takes to import with `python -X importtime`.
+
+Run from the tests folder: `PYTHONPATH=.. python -m benchmarks.bench_import_time`
+Pass a budget in ms to exit 1 if the median import time is over it.
+"""
+import os
+import statistics
+import subprocess as sp
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))))
+ENTRYPOINT = 'merakygen.codegen_main'
+# Modules that only the stages that use them should import.
+LAZY_MODULES = ['requests', 'yapf', 'pylint', 'merakygen._web',
+                'merakygen.make_python_script', 'merakygen.make_ruby_script',
+                'merakygen.make_bash_script',
+                'merakygen.make_powershell_module']
+
+
+def get_import_times(module=ENTRYPOINT):
+    """Import module in a new interpreter and get {module: cumulative µs}."""
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    result = sp.run([sys.executable, '-X', 'importtime', '-c',
+                     'import ' + module], env=env, stderr=sp.PIPE,
+                    check=True, universal_newlines=True)
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        import_times[name.strip()] = int(cumulative)
+    return import_times
+
+
+def get_eager_modules(import_times):
+    """Get the LAZY_MODULES (or their submodules) that were imported."""
+    return sorted(name for name in import_times for lazy in LAZY_MODULES
+                  if name == lazy or name.startswith(lazy + '.'))
+
+
+def main(budget_ms=0, num_runs=10):
+    """Print the median import time of the CLI and its slowest imports."""
+    runs = [get_import_times() for _ in range(num_runs)]
+    median_ms = statistics.median(run[ENTRYPOINT] for run in runs) / 1000
+    print('import {}: {:.1f}ms (median of {} runs)'.format(
+        ENTRYPOINT, median_ms, num_runs))
+    slowest = sorted(runs[-1].items(), key=lambda item: -item[1])[:10]
+    for name, cumulative in slowest:
+        print('  {:40} {:8.1f}ms'.format(name, cumulative / 1000))
+    eager_modules = get_eager_modules(runs[-1])
+    if eager_modules:
+        print('Imported at startup but should be lazy: ' +
+              ', '.join(eager_modules))
+    if eager_modules or (budget_ms and median_ms > budget_ms):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark graceful_exit with each installed JSON backend.
+
+The sample_resp of every list endpoint in api.json is scaled up to as many
+items as a big org's client or SM device list.
+
+Run from the tests folder: `PYTHONPATH=.. python -m benchmarks.bench_json_backend`
+"""
+import json
+import sys
+import timeit
+import types
+
+from tests.mock_server import load_api_calls, make_generated_module
+
+
+def make_responses(num_items):
+    """Get fake responses of each list sample_resp scaled to num_items."""
+    responses = []
+    for api_call in load_api_calls():
+        if api_call.func_return_type != 'list':
+            continue
+        items = json.loads(api_call.sample_resp)
+        if not items:
+            continue
+        body = json.dumps(items * (num_items // len(items))).encode('utf-8')
+        responses.append(types.SimpleNamespace(
+            content=body, text=body.decode('utf-8'), status_code=200))
+    return responses
+
+
+def main(num_items=10000, repeat=3):
+    """Time decoding every scaled response with each backend."""
+    api = make_generated_module('http://127.0.0.1')
+    responses = make_responses(num_items)
+    total_mb = sum(len(resp.content) for resp in responses) / 1e6
+    print('{} responses of {} items, {:.1f} MB'.format(
+        len(responses), num_items, total_mb))
+
+    def decode_text():
+        """What graceful_exit did before: json.loads(response.text)."""
+        for resp in responses:
+            json.loads(resp.text)
+
+    def graceful_exit():
+        """graceful_exit with the current backend."""
+        for resp in responses:
+            api.graceful_exit(resp)
+
+    baseline = min(timeit.repeat(decode_text, number=1, repeat=repeat))
+    print('  {:22}{:8.3f}s'.format('json.loads(text)', baseline))
+    for backend in api.JSON_BACKENDS:
+        api.set_json_backend(backend)
+        seconds = min(timeit.repeat(graceful_exit, number=1, repeat=repeat))
+        print('  {:22}{:8.3f}s  {:5.2f}x'.format(
+            backend + '.loads(content)', seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
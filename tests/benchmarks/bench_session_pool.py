@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark keep-alive through the shared session vs a connection per call.
+
+Rate limiting is turned off, as it would pace both to 5 calls/s.
+
+Run from the tests folder: `PYTHONPATH=.. python -m benchmarks.bench_session_pool`
+"""
+import sys
+import time
+
+import requests
+
+from tests.mock_server import MockMerakiServer, make_generated_module
+
+
+def time_calls(func, num_calls):
+    """Return the seconds it takes to call func num_calls times."""
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        func()
+    return time.perf_counter() - start
+
+
+def main(num_calls=1000):
+    """Compare per-call requests.get with the generated pooled session."""
+    with MockMerakiServer() as server:
+        api = make_generated_module(server.base_url)
+        # Every call is on one org, which would be held to RATE_LIMIT/s.
+        api.configure_rate_limit(0)
+        url = server.base_url + '/organizations/1234/admins'
+
+        def unpooled():
+            """What generated functions did before: a connection per call."""
+            return api.graceful_exit(requests.get(url, headers=api.HEADERS))
+
+        def pooled():
+            """Generated function on the shared session."""
+            return api.get_admins_by_org_id('1234')
+
+        unpooled_time = time_calls(unpooled, num_calls)
+        unpooled_conns = server.connections
+        pooled_time = time_calls(pooled, num_calls)
+        pooled_conns = server.connections - unpooled_conns
+
+    print('{} calls against {}'.format(num_calls, server.base_url))
+    print('  requests.get  {:8.3f}s  {:5d} connections'.format(
+        unpooled_time, unpooled_conns))
+    print('  SESSION       {:8.3f}s  {:5d} connections'.format(
+        pooled_time, pooled_conns))
+    print('  speedup       {:8.2f}x'.format(unpooled_time / pooled_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Make api.json specs with more endpoints than Meraki has (yet).
+
+Copies of the sections of a spec have their last static path segment tagged,
+like /networks/[network_id]/copyBSsids, so that every copy of an endpoint
+gets its own function name.
+
+fuzz_spec also mutates the copies like a growing API would: path params in
+other styles and nested under organizations, more (and nested) params, and
+longer descriptions and sample responses. It is seeded, so a seed always
+makes the same spec. To write one:
+`PYTHONPATH=.. python -m benchmarks.synthetic_spec <endpoints> <file> [seed]`
+"""
+import copy
+import json
+import random
+import re
+import sys
+
+from merakygen.create_method import get_path_args, inflect
+from tests.mock_server import STATIC_API_JSON
+
+SEED = 20190204
+# Path params that get_path_args and generate_api_call_words special case.
+SPECIAL_PATH_PARAMS = ['[id]', '[number]', '[srId]', '[service]']
+FUZZ_WORDS = ['uplink', 'vlan', 'policy', 'tunnel', 'beacon', 'schedule',
+              'quota', 'radius', 'subnet', 'portal', 'sensor', 'gateway']
+FUZZ_SENTENCES = [
+    'Only applies to networks with a <a href="https://documentation.meraki'
+    '.com/General_Administration">supported product</a>.',
+    "Values like 'auto' or \"none\" keep the current $setting.",
+    'Changes take up to 5 minutes (or longer for 100+ devices) to apply.',
+    'Überprüfen Sie die Einstellungen, bevor Sie fortfahren.',
+]
+
+
+def load_spec(filename=STATIC_API_JSON):
+    """Load an api.json spec."""
+    with open(filename, encoding='utf-8') as file_obj:
+        return json.load(file_obj)
+
+
+def get_tag(index):
+    """Get a tag of letters only (like copyBa) that inflection leaves alone."""
+    letters = ''
+    while True:
+        index, remainder = divmod(index, 26)
+        letters = chr(ord('a') + remainder) + letters
+        if not index:
+            break
+    return 'copy' + letters.capitalize()
+
+
+def tag_path(path, tag):
+    """Tag the last static segment of a path, which the func name uses."""
+    segments = path.split('/')
+    for index in range(len(segments) - 1, -1, -1):
+        segment = segments[index]
+        if re.match(r'[A-Za-z]', segment):
+            segments[index] = tag + segment[0].upper() + segment[1:]
+            # get_path_args names [id] and [number] after the segment before
+            # them, so name them after the untagged one to keep the args.
+            if segments[index + 1:index + 2] in [['[id]'], ['[number]']]:
+                segments[index + 1] = '[{}_{}]'.format(
+                    segment, segments[index + 1][1:-1])
+            break
+    return '/'.join(segments)
+
+
+def scale_spec(api_json, num_endpoints):
+    """Get a spec of num_endpoints endpoints from copies of api_json's."""
+    scaled_json = {}
+    num_copies = 0
+    count = 0
+    while count < num_endpoints:
+        for section, api_calls in api_json.items():
+            section_copy = []
+            for api_call in api_calls[:num_endpoints - count]:
+                api_call = copy.deepcopy(api_call)
+                if num_copies:
+                    api_call['path'] = tag_path(api_call['path'],
+                                                get_tag(num_copies))
+                section_copy.append(api_call)
+            count += len(section_copy)
+            if section_copy:
+                name = section if not num_copies else '{} ({})'.format(
+                    section, get_tag(num_copies))
+                scaled_json[name] = section_copy
+        num_copies += 1
+    return scaled_json
+
+
+def fuzz_path(path, rng):
+    """Change the style of path params or nest the path under an org."""
+    def restyle(match):
+        """Write a param like [networkId] as [network_id] or {networkId}."""
+        if match.group(0) in SPECIAL_PATH_PARAMS:
+            return match.group(0)
+        name = rng.choice([inflect('underscore', match.group(1)),
+                           inflect('camelize', match.group(1))])
+        name = name[0].lower() + name[1:]
+        return rng.choice(['[{}]', '{{{}}}']).format(name)
+
+    restyled_path = re.sub(r'[\[{]([A-Za-z_]+)[\]}]', restyle, path)
+    # Some args are named by the spelling of the param, like [networks_id].
+    if get_path_args(restyled_path, False) == get_path_args(path, False):
+        path = restyled_path
+    if path.startswith('/networks/') and rng.random() < 0.2:
+        path = '/organizations/[organizationId]' + path
+    return path
+
+
+def fuzz_description(description, rng):
+    """Make a description longer, with html links and chars to escape."""
+    sentences = rng.sample(FUZZ_SENTENCES, rng.randint(0, 3))
+    return ' '.join([description.rstrip()] + sentences)
+
+
+def make_param(rng, name, is_array=False):
+    """Make a param like the ones in api.json."""
+    param = {'name': name, 'is_array': is_array,
+             'description': fuzz_description('The ' + name, rng)}
+    if is_array:  # Arrays have one level of nested params.
+        param['params'] = [make_param(rng, word) for word in rng.sample(
+            FUZZ_WORDS, rng.randint(1, 3))]
+    return param
+
+
+def fuzz_params(params, rng):
+    """Get params with new (and nested) params and longer descriptions."""
+    params = params or []
+    for param in params:
+        param['description'] = fuzz_description(param['description'], rng)
+    names = {param['name'] for param in params}
+    for word in rng.sample(FUZZ_WORDS, rng.randint(0, 4)):
+        name = word + 'Settings'
+        if name not in names:
+            names.add(name)
+            params.append(make_param(rng, name, rng.random() < 0.3))
+    return params
+
+
+def fuzz_sample_resp(sample_resp, rng):
+    """Add fields and list items to a json sample response."""
+    try:
+        resp = json.loads(sample_resp)
+    except ValueError:  # Like '(empty)'
+        return sample_resp
+    items = resp if isinstance(resp, list) else [resp]
+    for item in items:
+        if isinstance(item, dict):
+            for word in rng.sample(FUZZ_WORDS, rng.randint(0, 3)):
+                item[word] = rng.choice([
+                    rng.randint(0, 10000), word + ' value', [1, 2, 3],
+                    {'enabled': True, 'name': word}])
+    if isinstance(resp, list) and resp:
+        resp += [copy.deepcopy(rng.choice(resp))
+                 for _ in range(rng.randint(0, 3))]
+    return json.dumps(resp, indent=2, ensure_ascii=False)
+
+
+def fuzz_spec(api_json, num_endpoints, seed=SEED):
+    """Get a scale_spec of api_json with every copied endpoint mutated."""
+    rng = random.Random(seed)
+    fuzzed_json = scale_spec(api_json, num_endpoints)
+    for section, api_calls in fuzzed_json.items():
+        if section in api_json:  # The original endpoints are left as is.
+            continue
+        for api_call in api_calls:
+            api_call['path'] = fuzz_path(api_call['path'], rng)
+            api_call['description'] = fuzz_description(
+                api_call['description'], rng)
+            if api_call['http_method'] != 'DELETE':  # Never has params.
+                api_call['params'] = fuzz_params(api_call.get('params'), rng)
+            api_call['sample_resp'] = fuzz_sample_resp(
+                api_call['sample_resp'], rng)
+    return fuzzed_json
+
+
+def main(num_endpoints, filename, seed=SEED):
+    """Write a fuzzed spec of num_endpoints endpoints to filename."""
+    fuzzed_json = fuzz_spec(load_spec(), int(num_endpoints), int(seed))
+    with open(filename, 'w', encoding='utf-8') as file_obj:
+        json.dump(fuzzed_json, file_obj, indent=2, ensure_ascii=False)
+    print('Wrote {} endpoints in {} sections to {}'.format(
+        sum(len(api_calls) for api_calls in fuzzed_json.values()),
+        len(fuzzed_json), filename))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
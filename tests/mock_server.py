@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local HTTP/1.1 server that stands in for the Meraki API.
+
+Also has helpers to generate and import the python module so that tests and
+benchmarks can call generated functions without an API key or network.
+"""
+import http.server
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+
+import merakygen.create_method as make_method
+import merakygen.make_python_script as mps
+
+STATIC_API_JSON = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'static', 'api.json')
+
+
+class MockMerakiHandler(http.server.BaseHTTPRequestHandler):
+    """Answer every request with the server's canned response.
+
+    HTTP/1.1 is used so that clients can keep connections alive.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately. Without this, Nagle's algorithm
+    # and delayed ACKs add ~40ms to every response on a kept-alive socket.
+    disable_nagle_algorithm = True
+
+    def handle_request(self):
+        """Record the request and send back the canned response."""
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.server.requests.append((self.command, self.path, body))
+        status, headers, payload = self.server.responder(self)
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keep test output quiet."""
+
+
+class MockMerakiServer(http.server.ThreadingHTTPServer):
+    """Threaded mock server. Use as a context manager.
+
+    responder(handler) returns (status, headers, payload_bytes). The default
+    returns an empty JSON list for every request.
+    """
+    daemon_threads = True
+
+    def __init__(self, responder=None):
+        super().__init__(('127.0.0.1', 0), MockMerakiHandler)
+        self.responder = responder or (
+            lambda handler: (200, {'Content-Type': 'application/json'},
+                             b'[]'))
+        self.requests = []
+        self.connections = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def get_request(self):
+        """Count accepted TCP connections to show keep-alive reuse."""
+        self.connections += 1
+        return super().get_request()
+
+    @property
+    def base_url(self):
+        """URL to use in place of the Meraki API base URL."""
+        return 'http://127.0.0.1:{}/api/v0'.format(self.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+def load_api_calls(language='python', options=None):
+    """Run the shipped api.json through modify_api_calls."""
+    with open(STATIC_API_JSON) as file_obj:
+        api_json = json.load(file_obj)
+    return make_method.modify_api_calls(api_json, options or [], language)
+
+
+def import_generated_module(text, name='pacg_meraki'):
+    """Write generated python to a temp dir and import it as a module."""
+    temp_dir = tempfile.mkdtemp()
+    filename = os.path.join(temp_dir, name + '.py')
+    with open(filename, 'w') as file_obj:
+        file_obj.write(text)
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_generated_module(base_url, options=None, is_async=False):
+    """Generate the python module from api.json, pointed at base_url."""
+    options = options or []
+    api_calls = load_api_calls('python', options)
+    text = mps.make_python_text('<key>', api_calls, 'Test module', options,
+                                is_async=is_async)
+    module = import_generated_module(
+        text, 'pacg_meraki_async' if is_async else 'pacg_meraki')
+    module.BASE_URL = base_url
+    return module
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test that reruns only regenerate endpoints that changed."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import merakygen.create_method as make_method
+import merakygen.make_bash_script as mbs
+import merakygen.make_powershell_module as mpss
+import merakygen.make_python_script as mps
+from tests.mock_server import load_api_calls
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_preamble(api_calls, options=()):
+    """Get the preamble of a run, which has its own date."""
+    return make_method.get_preamble(list(options), len(api_calls),
+                                    '{GET: 1}', 'powershell')
+
+
+def change_description(api_call):
+    """Change an endpoint like a new api.json would."""
+    api_call.description = api_call.func_desc = 'Changed description'
+
+
+class TestBuildManifest(unittest.TestCase):
+    """Generate twice in a scratch dir and compare what was written."""
+    def setUp(self):
+        # Powershell copies static files from ../static, so stay in the repo.
+        self.old_cwd = os.getcwd()
+        self.temp_dir = tempfile.mkdtemp(dir=REPO_DIR)
+        os.chdir(self.temp_dir)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.temp_dir)
+
+    def test_python_unchanged_is_not_rewritten(self):
+        """A rerun with the same spec leaves the module alone."""
+        api_calls = load_api_calls('python')
+        mps.make_python_script('<key>', api_calls, 'First run', [])
+        filename = 'pacg_meraki/pacg_meraki.py'
+        os.utime(filename, (0, 0))
+        mps.make_python_script('<key>', api_calls, 'Second run', [])
+        self.assertEqual(os.stat(filename).st_mtime, 0)
+
+        change_description(api_calls.endpoints[0])
+        api_calls.pop()
+        mps.make_python_script('<key>', api_calls, 'Third run', [])
+        self.assertNotEqual(os.stat(filename).st_mtime, 0)
+        with open(filename) as file_obj:
+            text = file_obj.read()
+        self.assertIn('Third run', text)
+        self.assertIn('Changed description', text)
+        self.assertEqual(text, mps.make_python_text(
+            '<key>', api_calls, 'Third run', []))
+
+    def test_bash_unchanged_is_not_rewritten(self):
+        """Single file outputs other than python also skip rewriting."""
+        api_calls = load_api_calls('bash')
+        mbs.make_bash_script('<key>', api_calls, 'First run', [])
+        os.utime('meraki_api.sh', (0, 0))
+        mbs.make_bash_script('<key>', api_calls, 'Second run', [])
+        self.assertEqual(os.stat('meraki_api.sh').st_mtime, 0)
+        mbs.make_bash_script('<key>', api_calls, 'Third run', ['--lint'])
+        self.assertNotEqual(os.stat('meraki_api.sh').st_mtime, 0)
+
+    def test_powershell_only_changed_files(self):
+        """Only files of changed endpoints are written or removed."""
+        api_calls = load_api_calls('powershell')
+        public_dir = 'ps_merakygen/Functions/Public/'
+        mpss.make_powershell_script('<key>', api_calls,
+                                    get_preamble(api_calls), [])
+        self.assertEqual(len(os.listdir(public_dir)), len(api_calls))
+        for filename in os.listdir(public_dir):
+            os.utime(public_dir + filename, (0, 0))
+
+        changed_call = api_calls.endpoints[0]
+        change_description(changed_call)
+        removed_call = api_calls.pop()
+        # The date and number of API calls in the preamble have changed.
+        mpss.make_powershell_script('<key>', api_calls,
+                                    get_preamble(api_calls), [])
+        self.assertFalse(os.path.exists(
+            public_dir + removed_call.gen_name + '.ps1'))
+        changed_files = [filename for filename in os.listdir(public_dir)
+                         if os.stat(public_dir + filename).st_mtime != 0]
+        self.assertEqual(changed_files, [changed_call.gen_name + '.ps1'])
+        with open('ps_merakygen/ps_merakygen.psd1') as file_obj:
+            psd1_text = file_obj.read()
+        self.assertIn("'" + changed_call.gen_name + "'", psd1_text)
+        self.assertNotIn("'" + removed_call.gen_name + "'", psd1_text)
+
+    def test_powershell_preamble_change(self):
+        """Every function is redone if the rest of the preamble changes."""
+        api_calls = load_api_calls('powershell')[:3]
+        public_dir = 'ps_merakygen/Functions/Public/'
+        mpss.make_powershell_script('<key>', api_calls, 'First run', [])
+        mpss.make_powershell_script('<key>', api_calls, 'Second run', [])
+        for filename in os.listdir(public_dir):
+            with open(public_dir + filename) as file_obj:
+                function_text = file_obj.read()
+            self.assertIn('Second run', function_text)
+            self.assertNotIn('Generated @', function_text)
+
+    def test_powershell_single_file(self):
+        """--single-file writes one .psm1 that exports every function."""
+        api_calls = load_api_calls('powershell')
+        options = ['--single-file']
+        mpss.make_powershell_script('<key>', api_calls,
+                                    get_preamble(api_calls, options), options)
+        self.assertEqual(sorted(os.listdir('ps_merakygen')),
+                         ['.ps_merakygen.psm1.manifest', 'ps_merakygen.psd1',
+                          'ps_merakygen.psm1'])
+        with open('ps_merakygen/ps_merakygen.psm1') as file_obj:
+            psm1_text = file_obj.read()
+        self.assertIn('function ParseParams', psm1_text)
+        self.assertEqual(psm1_text.count('Generated @'), 1)
+        self.assertIn('Export-ModuleMember -Function ' + mpss.ps_quote_list(
+            [api_call.gen_name for api_call in api_calls]), psm1_text)
+        with open('ps_merakygen/ps_merakygen.psd1') as file_obj:
+            self.assertIn("RootModule = 'ps_merakygen.psm1'", file_obj.read())
+
+        os.utime('ps_merakygen/ps_merakygen.psm1', (0, 0))
+        mpss.make_powershell_script('<key>', api_calls,
+                                    get_preamble(api_calls, options), options)
+        self.assertEqual(os.stat('ps_merakygen/ps_merakygen.psm1').st_mtime, 0)
+
+    def test_powershell_switch_layouts(self):
+        """Switching --single-file on and off rewrites the psd1 and removes
+        the files of the other layout."""
+        api_calls = load_api_calls('powershell')[:3]
+        preamble = get_preamble(api_calls)
+        for options, root_module in [([], 'MerakiAPI.psm1'),
+                                     (['--single-file'], 'ps_merakygen.psm1'),
+                                     ([], 'MerakiAPI.psm1')]:
+            mpss.make_powershell_script('<key>', api_calls, preamble, options)
+            with open('ps_merakygen/ps_merakygen.psd1') as file_obj:
+                self.assertIn("RootModule = '{}'".format(root_module),
+                              file_obj.read())
+            other_module = ({'MerakiAPI.psm1', 'ps_merakygen.psm1'} -
+                            {root_module}).pop()
+            self.assertFalse(os.path.exists('ps_merakygen/' + other_module))
+        self.assertEqual(len(os.listdir('ps_merakygen/Functions/Public')),
+                         len(api_calls))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test the cached formatting and linting of generated code."""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+from yapf.yapflib import yapf_api
+
+import merakygen._cache as cache
+import merakygen.lint as lint
+import merakygen.make_python_script as mps
+from tests.mock_server import load_api_calls
+
+
+class TestCodeQuality(unittest.TestCase):
+    """Format and lint generated code through a scratch cache dir."""
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        patcher = unittest.mock.patch.dict(
+            os.environ, {'MERAKYGEN_CACHE_DIR': self.cache_dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_format_parts_like_whole_file(self):
+        """Formatting each part is the same as formatting the whole file."""
+        api_calls = load_api_calls('python')[:40]
+        text_parts = mps.make_python_parts('<key>', api_calls, 'Test', [])
+        formatted_text = ''.join(mps.format_python_parts(text_parts[1:]))
+        self.assertEqual(
+            text_parts[0] + formatted_text.rstrip('\n') + '\n',
+            yapf_api.FormatCode(''.join(text_parts), style_config='pep8')[0])
+
+        with unittest.mock.patch.object(mps, 'format_python_part') as fmt:
+            cached_parts = mps.format_python_parts(text_parts[1:])
+            self.assertFalse(fmt.called)
+        self.assertEqual(''.join(cached_parts), formatted_text)
+
+    def test_api_key_is_not_cached(self):
+        """The runtime is cached with a placeholder instead of the key."""
+        api_key = 'f' * 40
+        text_parts = mps.make_python_parts(api_key, load_api_calls()[:2],
+                                           'Test', [])
+        formatted_parts = mps.format_python_parts(text_parts[1:], api_key)
+        self.assertIn(api_key, formatted_parts[0])
+        yapf_dir = os.path.join(self.cache_dir, 'yapf')
+        for filename in os.listdir(yapf_dir):
+            with open(os.path.join(yapf_dir, filename),
+                      encoding='utf-8') as file_obj:
+                self.assertNotIn(api_key, file_obj.read())
+
+        # Old files are evicted, and then the oldest until the rest fit.
+        cache_files = sorted(os.listdir(yapf_dir))
+        os.utime(os.path.join(yapf_dir, cache_files[0]), (0, 0))
+        os.utime(os.path.join(yapf_dir, cache_files[1]), (1e9, 1e9))
+        cache.evict_files(yapf_dir, mps.YAPF_CACHE_MAX_AGE, 1e12)
+        self.assertEqual(len(os.listdir(yapf_dir)), len(cache_files) - 2)
+        cache.evict_files(yapf_dir, 1e12, 1)
+        self.assertEqual(os.listdir(yapf_dir), [])
+
+    def test_lint_reuses_part_results(self):
+        """Only new or changed parts are linted again."""
+        api_calls = load_api_calls('python')[:4]
+        text_parts = mps.make_python_parts('<key>', api_calls, 'Test', [])
+        text_parts = [part.strip('\n') + '\n'
+                      for part in mps.format_python_parts(text_parts[2:])]
+        lint_args = [lint.PYLINT_CMD, lint.get_pylint_options(),
+                     lint.parse_pylint_output, lint.PYLINT_OK_CODES, '.py']
+        old_messages = lint.lint_parts(text_parts[:3], *lint_args)
+
+        bad_part = 'def bad_function(arg):\n    return 1\n'
+        with unittest.mock.patch.object(lint.sp, 'run',
+                                        wraps=lint.sp.run) as run:
+            messages = lint.lint_parts(text_parts + [bad_part], *lint_args)
+            # One call for the linter version and one for the new parts.
+            self.assertEqual(run.call_count, 2)
+            self.assertEqual(len(run.call_args[0][0]) -
+                             len(lint.PYLINT_CMD + lint_args[1]), 2)
+        self.assertEqual(messages[:3], old_messages)
+        self.assertEqual(messages[3], lint.lint_parts(
+            text_parts[3:], *lint_args)[0])
+        self.assertTrue(any('unused-argument' in msg for msg in messages[4]))
+
+    def test_lint_undefined_and_redefined_names(self):
+        """Names missing from the runtime and duplicate defs are reported."""
+        api_calls = load_api_calls('python')[:2]
+        text_parts = mps.make_python_parts('<key>', api_calls, 'Test', [])
+        func_name = api_calls.endpoints[0].gen_name
+        text_parts += ['\ndef {}():\n    """Again."""\n'.format(func_name),
+                       '\ndef uses_helper():\n    """Call a helper."""\n'
+                       '    return missing_helper(graceful_exit)\n']
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            mps.lint_parts('pacg_meraki', text_parts[1:])
+        output = stdout.getvalue()
+        self.assertIn("E0602 (undefined-variable) Undefined variable "
+                      "'missing_helper'", output)
+        self.assertNotIn("'graceful_exit'", output)
+        self.assertIn('E0102 (function-redefined)', output)
+
+    def test_lint_failures_are_not_cached(self):
+        """A linter that fails or prints no json raises and caches nothing."""
+        for exit_code, parse_output, ok_codes in [
+                (32, lint.parse_pylint_output, lint.PYLINT_OK_CODES),
+                (0, lint.parse_rubocop_output, lint.RUBOCOP_OK_CODES)]:
+            # Prints nothing and exits with exit_code, except for --version.
+            tool_cmd = [sys.executable, '-c', 'import sys; sys.exit(0 if '
+                        'sys.argv[1:] == ["--version"] else {})'.format(
+                            exit_code)]
+            with self.assertRaises(RuntimeError):
+                lint.lint_parts(['x = 1\n'], tool_cmd, [], parse_output,
+                                ok_codes, '.py')
+            self.assertEqual(
+                os.listdir(os.path.join(self.cache_dir, 'lint')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
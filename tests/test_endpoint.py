@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test the endpoints and indexes that modify_api_calls makes."""
+import json
+import pickle
+import unittest
+
+from merakygen.endpoint import Endpoint, EndpointTable
+from tests.mock_server import load_api_calls
+
+
+class TestEndpointTable(unittest.TestCase):
+    """Look up and change the endpoints of the shipped api.json."""
+    def setUp(self):
+        self.api_calls = load_api_calls('python')
+
+    def test_indexes(self):
+        """Endpoints are found by (http_method, path), section and name."""
+        api_call = self.api_calls.endpoints[10]
+        self.assertIs(self.api_calls.get(api_call.http_method,
+                                         api_call.path), api_call)
+        self.assertIn(api_call, self.api_calls.get_section(api_call.section))
+        self.assertEqual(self.api_calls.get_by_gen_name(api_call.gen_name),
+                         [api_call])
+        self.assertEqual(sum(len(self.api_calls.get_section(section))
+                             for section in self.api_calls.by_section),
+                         len(self.api_calls))
+        self.assertFalse(hasattr(api_call, '__dict__'))
+
+    def test_rename_and_remove(self):
+        """The indexes follow renamed and removed endpoints."""
+        api_call = self.api_calls.endpoints[0]
+        old_name = api_call.gen_name
+        self.api_calls.rename(api_call, 'renamed')
+        self.assertEqual(self.api_calls.get_by_gen_name(old_name), [])
+        self.assertEqual(self.api_calls.get_by_gen_name('renamed'),
+                         [api_call])
+
+        num_api_calls = len(self.api_calls)
+        self.assertIs(self.api_calls.pop(0), api_call)
+        self.assertEqual(len(self.api_calls), num_api_calls - 1)
+        self.assertIsNone(self.api_calls.get(api_call.http_method,
+                                             api_call.path))
+        self.assertEqual(self.api_calls.get_by_gen_name('renamed'), [])
+
+        self.api_calls.set_language('powershell')
+        self.assertTrue(self.api_calls.endpoints[0].gen_name.startswith(
+            ('Get-', 'Add-', 'Set-', 'Remove-')))
+
+    def test_round_trips(self):
+        """Tables survive json (the IR cache) and pickle (language procs)."""
+        json_table = EndpointTable.from_dicts(
+            json.loads(json.dumps(self.api_calls.to_dicts())))
+        self.assertEqual(json_table, self.api_calls)
+        self.assertEqual(pickle.loads(pickle.dumps(self.api_calls)),
+                         self.api_calls)
+        self.assertNotEqual(json_table[1:], self.api_calls)
+        self.assertEqual(Endpoint.from_spec('Admins', {'http_method': 'GET',
+                                                       'path': '/x'}).key,
+                         'GET /x')
+
+
+if __name__ == '__main__':
+    unittest.main()
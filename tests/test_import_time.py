@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Keep heavy imports out of CLI startup."""
+import os
+import subprocess as sp
+import sys
+import tempfile
+import unittest
+
+from tests.benchmarks.bench_import_time import REPO_DIR, get_eager_modules, \
+    get_import_times
+
+
+class TestImportTime(unittest.TestCase):
+    """Import the CLI in a new interpreter, like every call of it does."""
+    def test_no_heavy_imports_at_startup(self):
+        """requests, yapf, pylint and the emitters are imported lazily."""
+        self.assertEqual(get_eager_modules(get_import_times()), [])
+
+    def test_help_from_any_dir(self):
+        """--help and the changelog work outside of the repo."""
+        env = dict(os.environ, PYTHONPATH=REPO_DIR)
+        for args in [['-m', 'merakygen.codegen_main', '--help'],
+                     ['-c', 'import merakygen; print(merakygen.__changelog__)']]:
+            result = sp.run([sys.executable] + args, env=env,
+                            cwd=tempfile.gettempdir(), stdout=sp.PIPE,
+                            check=True, universal_newlines=True)
+            self.assertTrue(result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
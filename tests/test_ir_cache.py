@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test the on-disk cache of modified API calls."""
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import merakygen.create_method as make_method
+from tests.mock_server import STATIC_API_JSON
+
+
+def load_api_json():
+    """Get a fresh copy of the shipped api.json."""
+    with open(STATIC_API_JSON, encoding='utf-8') as file_obj:
+        return json.load(file_obj)
+
+
+class TestIRCache(unittest.TestCase):
+    """Get API calls through a scratch cache dir."""
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        patcher = unittest.mock.patch.dict(
+            os.environ, {'MERAKYGEN_CACHE_DIR': self.cache_dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_warm_run_skips_modify(self):
+        """The second run loads the same API calls from the cache."""
+        cold = make_method.get_api_calls(load_api_json(), 'python')
+        with unittest.mock.patch.object(
+                make_method, 'get_modified_api_calls') as modify_api_calls:
+            warm = make_method.get_api_calls(load_api_json(), 'python')
+            self.assertFalse(modify_api_calls.called)
+        self.assertEqual(warm, cold)
+        self.assertEqual(warm, make_method.modify_api_calls(
+            load_api_json(), [], 'python'))
+
+    def test_key_and_escape_hatch(self):
+        """Every language shares a cache entry and use_cache=False skips it."""
+        make_method.get_api_calls(load_api_json(), 'python')
+        with unittest.mock.patch.object(
+                make_method, 'get_modified_api_calls',
+                wraps=make_method.get_modified_api_calls) as modify_api_calls:
+            api_calls = make_method.get_api_calls(load_api_json(),
+                                                  'powershell')
+            self.assertEqual(modify_api_calls.call_count, 0)
+            self.assertEqual(api_calls, make_method.modify_api_calls(
+                load_api_json(), [], 'powershell'))
+            make_method.get_api_calls(load_api_json(), 'python',
+                                      use_cache=False)
+            self.assertEqual(modify_api_calls.call_count, 2)
+        ir_files = os.listdir(os.path.join(self.cache_dir, 'ir'))
+        self.assertEqual(len(ir_files), 1)
+
+    def test_warm_run_warns_about_collisions(self):
+        """Name collisions are saved in the cache and warned about again."""
+        api_json = load_api_json()
+        section = next(iter(api_json))
+        api_json[section].append(dict(api_json[section][0]))
+        api_json[section][-1]['path'] += '/'
+        outputs = []
+        for _ in range(2):
+            with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                make_method.get_api_calls(api_json, 'python')
+            outputs.append(stdout.getvalue())
+        self.assertIn('WARNING: Name collision in python', outputs[0])
+        self.assertEqual(outputs[1], outputs[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test that no two functions of a language get the same name."""
+import ast
+import contextlib
+import copy
+import io
+import unittest
+
+import merakygen.create_method as make_method
+import merakygen.make_powershell_module as mpss
+import merakygen.make_python_script as mps
+from tests.benchmarks.synthetic_spec import load_spec
+
+
+class TestNameCollisions(unittest.TestCase):
+    """Add endpoints to api.json that are named like existing ones."""
+    def setUp(self):
+        self.api_json = load_spec()
+        admins = self.api_json['Admins']
+        # 'organization' is shortened to 'org', so these have the same name.
+        for path in ['/orgs/[org_id]/admins', '/orgs/[organization_id]/admins']:
+            admins.append(dict(copy.deepcopy(admins[0]), path=path))
+
+    def test_collisions_are_numbered(self):
+        """Every language numbers the functions after the first."""
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            api_calls = make_method.modify_api_calls(self.api_json, [],
+                                                     'python')
+        self.assertIn('WARNING: Name collision in python: '
+                      '`get_admins_by_org_id` is used by GET /organizations/'
+                      '[organization_id]/admins, GET /orgs/[org_id]/admins, '
+                      'GET /orgs/[organization_id]/admins.', stdout.getvalue())
+        names = [api_call.gen_name for api_call in api_calls.get_section(
+            'Admins') if api_call.http_method == 'GET']
+        self.assertEqual(names, ['get_admins_by_org_id',
+                                 'get_admins_by_org_id_2',
+                                 'get_admins_by_org_id_3'])
+        for language in make_method.LANGUAGES:
+            self.assertEqual(max(make_method.get_symbol_counts(
+                [api_call.gen_names[language] for api_call in api_calls],
+                language).values()), 1)
+        module_text = mps.make_python_text('<key>', api_calls, 'Test', [])
+        self.assertIn('def get_admins_by_org_id_3(', module_text)
+
+    def test_powershell_ignores_case(self):
+        """Powershell names that only differ by case are a collision."""
+        api_calls = make_method.modify_api_calls(load_spec(), [],
+                                                 'powershell')
+        first, second = api_calls.endpoints[0], api_calls.endpoints[1]
+        first.gen_names['powershell'] = 'Get-Admins'
+        second.gen_names['powershell'] = 'Get-ADMINS'
+        collisions = make_method.resolve_name_collisions(api_calls,
+                                                         ['powershell'])
+        self.assertEqual(collisions, [('powershell', 'Get-Admins',
+                                       [first.key, second.key])])
+        self.assertEqual(second.gen_names['powershell'], 'Get-Admins2')
+
+        # Get-AdminsByOrgId is not truncated, as Get-ADMINS is taken.
+        api_calls.rename(first, 'Get-ADMINS')
+        api_calls.rename(second, 'Get-AdminsByOrgId')
+        mpss.truncate_func_name(api_calls)
+        self.assertEqual(second.gen_name, 'Get-AdminsByOrgId')
+        self.assertEqual(api_calls.get_by_gen_name('Get-AdminsByOrgId'),
+                         [second])
+        alert_settings = api_calls.get('GET',
+                                       '/networks/[networkId]/alertSettings')
+        self.assertEqual(alert_settings.gen_name, 'Get-AlertSettings')
+
+    def test_runtime_names_are_reserved(self):
+        """API calls are not named like a runtime helper or a *_iter."""
+        api_calls = make_method.modify_api_calls(load_spec(), [], 'python')
+        first, second = api_calls.endpoints[0], api_calls.endpoints[1]
+        first.gen_names['python'] = 'paginate'
+        second.gen_names['python'] = 'get_admins_iter'
+        api_calls.endpoints[2].gen_names['python'] = 'get_admins'
+        api_calls.endpoints[3].gen_names['python'] = 'paginate_2_iter'
+        collisions = make_method.resolve_name_collisions(api_calls,
+                                                         ['python'])
+        self.assertEqual(collisions, [
+            ('python', 'paginate', ['the runtime', first.key]),
+            ('python', 'get_admins_iter', [
+                api_calls.endpoints[2].key + ' (get_admins_iter)',
+                second.key])])
+        # paginate_2 would have the same *_iter as paginate_2_iter.
+        self.assertEqual(first.gen_names['python'], 'paginate_3')
+        self.assertEqual(second.gen_names['python'], 'get_admins_iter_2')
+
+    def test_reserved_names_cover_the_runtime(self):
+        """Every function, class and import of the python runtimes, also in
+        try: blocks and async ones, is reserved."""
+        reserved = make_method.get_reserved_names('python')
+        for is_async in [False, True]:
+            runtime = ast.parse(mps.make_runtime('<key>', is_async))
+            nodes = list(runtime.body)
+            for node in runtime.body:
+                if isinstance(node, ast.Try):
+                    nodes += node.body + node.orelse + [
+                        child for handler in node.handlers
+                        for child in handler.body]
+            for node in nodes:
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                                     ast.ClassDef)):
+                    names = [node.name]
+                elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                    names = [(alias.asname or alias.name).split('.')[0]
+                             for alias in node.names]
+                else:
+                    continue
+                for name in names:
+                    self.assertIn(name, reserved)
+        for name in ['paginate', 'close_client', 'orjson', 'httpx']:
+            self.assertIn(name, reserved)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test the psd1 manifest against one that New-ModuleManifest made."""
+import datetime
+import os
+import re
+import unittest
+
+import merakygen.make_powershell_module as mpss
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PWSH_PSD1 = os.path.join(REPO_DIR, 'generated', 'MerakiAPI', 'MerakiAPI.psd1')
+
+
+class TestPowershellManifest(unittest.TestCase):
+    """Write the psd1 with the values that generated/MerakiAPI was made with."""
+    def test_same_as_new_module_manifest(self):
+        """The text is the same as pwsh's, down to how lists are wrapped."""
+        with open(PWSH_PSD1, encoding='utf-8') as file_obj:
+            pwsh_text = file_obj.read()
+        exports = re.search(r'\nFunctionsToExport = (.*?)\n\n', pwsh_text,
+                            re.S).group(1)
+        psd1_text = mpss.make_psd1_text('MerakiAPI', {
+            'RootModule': '/Users/rj/code/merakygen/merakygen/MerakiAPI/'
+                          'MerakiAPI.psm1',
+            'ModuleVersion': '0.2.0',
+            'GUID': '5d588d4c-4c86-4568-bec8-525f15084c23',
+            'Author': 'Ross Jacobs <rossbjacobs@gmail.com>',
+            'CompanyName': 'Ross Jacobs',
+            'Copyright': 'Ross Jacobs 2019 All Rights Reserved.',
+            'Description': 'Generate a module to access the Meraki API in '
+                           '$language',
+            'PowerShellVersion': '5.0',
+            'FunctionsToExport': re.findall(r"'(\w+)'", exports),
+            'Tags': ['Meraki', 'API', 'Networking'],
+            'LicenseUri': 'https://github.com/pocc/merakygen/blob/master/'
+                          'LICENSE.txt',
+            'ProjectUri': 'https://github.com/pocc/merakygen',
+            'ReleaseNotes': '[0.2.1] - 2019-02-04\n  Added\n\t* Added this '
+                            'Changelog',
+            'HelpInfoURI': 'https://github.com/pocc/merakygen',
+        }, generated_on=datetime.date(2019, 2, 4))
+        self.assertEqual(psd1_text, pwsh_text)
+
+    def test_quoting(self):
+        """Quotes are doubled and empty lists are @()."""
+        self.assertEqual(mpss.ps_quote("it's $x"), "'it''s $x'")
+        self.assertEqual(mpss.ps_quote_list([]), '@()')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test the runtime of the generated python module against a mock server."""
+import asyncio
+import importlib.util
+import json
+import time
+import unittest
+import warnings
+
+from tests.mock_server import MockMerakiServer, make_generated_module
+
+
+def make_pages(num_pages):
+    """Get a responder that serves [1], [2], ... one page per request."""
+    def responder(handler):
+        """Link to the next page until the last page."""
+        page = int(handler.path.split('startingAfter=')[-1]) \
+            if 'startingAfter=' in handler.path else 1
+        headers = {}
+        if page < num_pages:
+            next_url = 'http://{}:{}{}&startingAfter={}'.format(
+                *handler.server.server_address, handler.path.split('&')[0],
+                page + 1)
+            headers['Link'] = '<{}>; rel=next'.format(next_url)
+        return 200, headers, '[{}]'.format(page).encode()
+    return responder
+
+
+class TestPythonRuntime(unittest.TestCase):
+    """Call generated functions against a local mock of the API."""
+    def test_session_reuses_connections(self):
+        """All calls should go through one kept-alive connection."""
+        with MockMerakiServer() as server:
+            api = make_generated_module(server.base_url)
+            api.configure_rate_limit(0)  # 20 calls on one org
+            for _ in range(20):
+                self.assertEqual(api.get_admins_by_org_id('1234'), [])
+            self.assertEqual(len(server.requests), 20)
+            self.assertEqual(server.connections, 1)
+            self.assertEqual(server.requests[0][:2],
+                             ('GET', '/api/v0/organizations/1234/admins'))
+
+    def test_configure_session_pool_size(self):
+        """The pool size should be configurable after import."""
+        with MockMerakiServer() as server:
+            api = make_generated_module(server.base_url)
+            api.configure_session(pool_connections=2, pool_maxsize=32)
+            adapter = api.SESSION.get_adapter(server.base_url)
+            self.assertEqual(adapter._pool_maxsize, 32)
+            self.assertEqual(api.get_admins_by_org_id('1'), [])
+
+    def test_json_backends(self):
+        """Every installed backend decodes responses and encodes params."""
+        def echo(handler):
+            """Send the request body back."""
+            return 200, {}, handler.server.requests[-1][2]
+
+        with MockMerakiServer(echo) as server:
+            api = make_generated_module(server.base_url)
+            self.assertEqual(api.JSON_CODEC.name,
+                             next(iter(api.JSON_BACKENDS)))
+            for backend in api.JSON_BACKENDS:
+                api.set_json_backend(backend)
+                self.assertEqual(
+                    api.update_admin_by_admin_id('1', '2', {'name': 'é'}),
+                    {'name': 'é'})
+            with self.assertRaises(ValueError):
+                api.set_json_backend('simplejson')
+
+    def test_rate_limit_per_org(self):
+        """Calls on one org are paced while other orgs are not held up."""
+        with MockMerakiServer() as server:
+            api = make_generated_module(server.base_url)
+            api.configure_rate_limit(rate=50, burst=1)
+            api.register_networks([{'id': 'N_1', 'organizationId': '1'}])
+            start = time.monotonic()
+            for _ in range(5):
+                api.get_admins_by_org_id('1')
+                api.get_alert_settings_by_network_id('N_1')
+            self.assertGreaterEqual(time.monotonic() - start, 9 / 50)
+            start = time.monotonic()
+            api.get_admins_by_org_id('2')
+            self.assertLess(time.monotonic() - start, 1 / 50)
+            self.assertEqual(set(api.RATE_LIMITER.buckets), {'1', '2'})
+
+    def test_unregistered_network_warns(self):
+        """Networks that are not registered are limited on their own."""
+        with MockMerakiServer() as server:
+            api = make_generated_module(server.base_url)
+            with self.assertWarnsRegex(UserWarning, 'register_networks'):
+                api.get_alert_settings_by_network_id('N_2')
+            self.assertIn('N_2', api.RATE_LIMITER.buckets)
+            api.register_networks([{'id': 'N_2', 'organizationId': '2'}])
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                api.get_alert_settings_by_network_id('N_2')
+            self.assertIn('2', api.RATE_LIMITER.buckets)
+
+    def test_retry_after_then_success(self):
+        """Retry 429/503 on GET, honoring Retry-After, and count retries."""
+        statuses = [429, 503, 200]
+
+        def responder(_):
+            """Throttle, then fail, then succeed."""
+            return statuses.pop(0), {'Retry-After': '0'}, b'[]'
+
+        with MockMerakiServer(responder) as server:
+            api = make_generated_module(server.base_url)
+            self.assertEqual(api.get_admins_by_org_id('1'), [])
+            self.assertEqual(len(server.requests), 3)
+            stats = api.get_retry_stats()
+            self.assertEqual(stats['retries'], 2)
+            self.assertEqual(stats['by_status'], {429: 1, 503: 1})
+            self.assertEqual(stats['exhausted'], 0)
+
+    def test_retry_budget_and_methods(self):
+        """POST is not retried and retries stop at max_retries."""
+        with MockMerakiServer(lambda _: (503, {}, b'')) as server:
+            api = make_generated_module(server.base_url)
+            api.configure_retries(max_retries=2, backoff_base=0.001)
+            self.assertEqual(api.create_admin_by_org_id('1', {}), 503)
+            self.assertEqual(len(server.requests), 1)
+            self.assertEqual(api.get_admins_by_org_id('1'), 503)
+            self.assertEqual(len(server.requests), 4)
+            self.assertEqual(api.get_retry_stats()['exhausted'], 1)
+
+    def test_response_cache(self):
+        """Repeated GETs are cached until a write on the same resource."""
+        with MockMerakiServer() as server:
+            api = make_generated_module(server.base_url)
+            self.assertEqual(api.get_cache_stats()['hits'], 0)
+            api.configure_cache(ttls={'get_alert_settings_by_network_id': 0})
+            for _ in range(3):
+                api.get_admins_by_org_id('1')
+                api.get_admins_by_org_id('2')
+                api.get_alert_settings_by_network_id('N_1')
+            self.assertEqual(len(server.requests), 5)
+            api.update_admin_by_admin_id('1', '3', {'name': 'Miles'})
+            api.get_admins_by_org_id('1')
+            api.get_admins_by_org_id('2')
+            self.assertEqual(len(server.requests), 7)
+            stats = api.get_cache_stats()
+            self.assertEqual(stats['hits'], 5)
+            self.assertEqual(stats['invalidations'], 1)
+            self.assertEqual(stats['entries'], 2)
+
+    def test_response_cache_limits(self):
+        """Least recently used responses are evicted past max_entries."""
+        with MockMerakiServer() as server:
+            api = make_generated_module(server.base_url)
+            api.configure_cache(max_entries=2)
+            for org_id in ['1', '2', '1', '3', '2']:
+                api.get_admins_by_org_id(org_id)
+            self.assertEqual(len(server.requests), 4)
+            self.assertEqual(api.get_cache_stats()['evictions'], 2)
+
+    def test_iter_follows_link_header(self):
+        """Iterators yield items from every page with the max page size."""
+        with MockMerakiServer(make_pages(3)) as server:
+            api = make_generated_module(server.base_url)
+            items = api.get_bluetooth_clients_by_network_id_iter('N_1')
+            self.assertEqual(next(items), 1)
+            self.assertEqual(len(server.requests), 1)
+            self.assertEqual(list(items), [2, 3])
+            self.assertIn('perPage=1000', server.requests[0][1])
+            prefetched = api.get_bluetooth_clients_by_network_id_iter(
+                'N_1', {'perPage': '3'}, prefetch=True)
+            self.assertEqual(list(prefetched), [1, 2, 3])
+            self.assertIn('perPage=3', server.requests[-1][1])
+            self.assertFalse(
+                hasattr(api, 'get_alert_settings_by_network_id_iter'))
+
+    def test_shard_redirect_is_cached(self):
+        """Only the first call on an org goes through the redirect."""
+        with MockMerakiServer() as shard:
+            shard_host = shard.base_url.replace('/api/v0', '')
+
+            def redirect(handler):
+                """Send every call to the shard."""
+                return 308, {'Location': shard_host + handler.path}, b''
+
+            with MockMerakiServer(redirect) as server:
+                api = make_generated_module(server.base_url)
+                api.update_admin_by_admin_id('1', '2', {'name': 'Miles'})
+                api.get_admins_by_org_id('1')
+                api.get_admins_by_org_id('1')
+                self.assertEqual(len(server.requests), 1)
+                self.assertEqual([req[0] for req in shard.requests],
+                                 ['PUT', 'GET', 'GET'])
+                self.assertEqual(json.loads(shard.requests[0][2]),
+                                 {'name': 'Miles'})
+                self.assertEqual(api.SHARD_CACHE.get('1'), shard.base_url)
+
+                shard.responder = lambda _: (404, {}, b'')
+                api.get_admins_by_org_id('1')
+                self.assertEqual(len(server.requests), 2)
+
+
+@unittest.skipUnless(importlib.util.find_spec('httpx'), 'httpx not installed')
+class TestAsyncPythonRuntime(unittest.TestCase):
+    """Await generated coroutines against a local mock of the API."""
+    def test_concurrent_calls(self):
+        """Coroutines share one client and can be gathered."""
+        with MockMerakiServer() as server:
+            api = make_generated_module(server.base_url, is_async=True)
+
+            async def gather_calls():
+                """Run many calls on one event loop."""
+                results = await asyncio.gather(*[
+                    api.get_admins_by_org_id(str(org_id))
+                    for org_id in range(50)])
+                await api.close_client()
+                return results
+
+            self.assertEqual(asyncio.run(gather_calls()), 50 * [[]])
+            paths = sorted(path for _, path, _ in server.requests)
+            self.assertEqual(len(paths), 50)
+            self.assertIn('/api/v0/organizations/49/admins', paths)
+
+    def test_put_sends_json_body(self):
+        """PUT params are sent as a JSON body, like the sync module."""
+        with MockMerakiServer() as server:
+            api = make_generated_module(server.base_url, is_async=True)
+
+            async def update():
+                """Update an admin and close the client."""
+                result = await api.update_admin_by_admin_id(
+                    '1', '2', {'name': 'Miles'})
+                await api.close_client()
+                return result
+
+            asyncio.run(update())
+            http_method, path, body = server.requests[0]
+            self.assertEqual((http_method, path), (
+                'PUT', '/api/v0/organizations/1/admins/2'))
+            self.assertEqual(json.loads(body), {'name': 'Miles'})
+
+    def test_iter_prefetch(self):
+        """Async iterators yield items from every page."""
+        with MockMerakiServer(make_pages(4)) as server:
+            api = make_generated_module(server.base_url, is_async=True)
+
+            async def collect():
+                """Collect every item and close the client."""
+                items = [item async for item in
+                         api.get_bluetooth_clients_by_network_id_iter(
+                             'N_1', prefetch=True)]
+                await api.close_client()
+                return items
+
+            self.assertEqual(asyncio.run(collect()), [1, 2, 3, 4])
+
+    def test_shard_redirect_is_cached(self):
+        """Redirects are followed by hand and the shard is reused."""
+        with MockMerakiServer() as shard:
+            shard_host = shard.base_url.replace('/api/v0', '')
+
+            def redirect(handler):
+                """Send every call to the shard."""
+                return 307, {'Location': shard_host + handler.path}, b''
+
+            with MockMerakiServer(redirect) as server:
+                api = make_generated_module(server.base_url, is_async=True)
+
+                async def get_twice():
+                    """Call the same org twice and close the client."""
+                    await api.get_admins_by_org_id('1')
+                    await api.get_admins_by_org_id('1')
+                    await api.close_client()
+
+                asyncio.run(get_twice())
+                self.assertEqual(len(server.requests), 1)
+                self.assertEqual(len(shard.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test that fuzzed specs are reproducible and still generate."""
+import contextlib
+import io
+import unittest
+
+import merakygen.create_method as make_method
+import merakygen.make_python_script as mps
+from tests.benchmarks.bench_generator import DOCSTRING_RENDERERS
+from tests.benchmarks.synthetic_spec import fuzz_spec, load_spec
+
+NUM_ENDPOINTS = 1000
+
+
+class TestSyntheticSpec(unittest.TestCase):
+    """Fuzz static/api.json to more endpoints than it has."""
+    def test_same_seed_same_spec(self):
+        """A seed always makes the same spec, and other seeds do not."""
+        self.assertEqual(fuzz_spec(load_spec(), 300, seed=1),
+                         fuzz_spec(load_spec(), 300, seed=1))
+        self.assertNotEqual(fuzz_spec(load_spec(), 300, seed=1),
+                            fuzz_spec(load_spec(), 300, seed=2))
+
+    def test_fuzzed_spec_generates(self):
+        """Names do not collide and every API call renders to valid python."""
+        fuzzed_json = fuzz_spec(load_spec(), NUM_ENDPOINTS)
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            api_calls = make_method.modify_api_calls(fuzzed_json, [],
+                                                     'python')
+        self.assertNotIn('Untracked API Primitive', stdout.getvalue())
+        self.assertEqual(len(api_calls), NUM_ENDPOINTS)
+        # Fuzzed paths get names of their own instead of numbered ones.
+        self.assertEqual(make_method.get_modified_api_calls(fuzzed_json)[1],
+                         [])
+        self.assertNotIn('Name collision', stdout.getvalue())
+
+        for renderer in DOCSTRING_RENDERERS.values():
+            for api_call in api_calls:
+                self.assertTrue(renderer(api_call))
+        compile(mps.make_python_text('<key>', api_calls, 'Fuzzed', []),
+                'pacg_meraki.py', 'exec')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test the per-stage timings of --timings and --profile."""
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+import merakygen._timings as timings
+import merakygen.codegen_main as codegen_main
+from tests.mock_server import load_api_calls
+
+
+class TestTimings(unittest.TestCase):
+    """Generate bash in a scratch dir with stages recorded."""
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.temp_dir = tempfile.mkdtemp()
+        os.chdir(self.temp_dir)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.temp_dir)
+        timings.configure([])
+
+    def test_no_options_no_stages(self):
+        """Stages are not recorded by default."""
+        _, stages = codegen_main.make_script(
+            '<key>', load_api_calls('bash'), 'bash', [])
+        self.assertEqual(stages, {})
+
+    def test_timings_report(self):
+        """--timings records the wall and CPU time of each stage."""
+        _, stages = codegen_main.make_script(
+            '<key>', load_api_calls('bash'), 'bash', ['--timings'])
+        self.assertEqual(sorted(stages), [
+            'bash.emit', 'bash.get_http_stats', 'bash.preamble',
+            'bash.write'])
+        for timing in stages.values():
+            self.assertEqual(timing['count'], 1)
+            self.assertGreaterEqual(timing['wall_s'], 0)
+            self.assertGreaterEqual(timing['cpu_s'], 0)
+
+        timings.save_report(stages, {'bash': 0.1}, ['--timings'])
+        with open(timings.TIMINGS_FILE, encoding='utf-8') as file_obj:
+            self.assertEqual(json.load(file_obj)['stages'], stages)
+
+    def test_memory_report(self):
+        """--memory records the peak and retained memory of each stage."""
+        _, stages = codegen_main.make_script(
+            '<key>', load_api_calls('bash'), 'bash', ['--memory'])
+        emit = stages['bash.emit']
+        self.assertGreater(emit['retained_kib'], 0)
+        self.assertGreaterEqual(emit['peak_kib'], emit['retained_kib'])
+        self.assertIn('make_bash_script.py', emit['top_sites'][0]['site'])
+        self.assertEqual(
+            timings.get_language_memory(stages, ['bash'])['bash']['peak_kib'],
+            max(timing['peak_kib'] for timing in stages.values()))
+
+    def test_profile_dumps(self):
+        """--profile dumps the pstats of each stage."""
+        _, stages = codegen_main.make_script(
+            '<key>', load_api_calls('bash'), 'bash', ['--profile'])
+        stats = pstats.Stats(stages['bash.emit']['profile'])
+        self.assertTrue(any(func[2] == 'make_bash_function'
+                            for func in stats.stats))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Ross Jacobs All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Test fetching and caching the apidocs spec against a mock server."""
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import merakygen._cache as cache
+import merakygen._web as web
+from tests.mock_server import MockMerakiServer
+
+API_JSON = b'[{"section": "Admins", "endpoints": []}]'
+PAGE = b'<html><script>\n  window.allApisJson = ' + API_JSON + \
+    b';\n  </script>' + b'<p>Rest of the page</p>' * 1000
+
+
+def serve_apidocs(handler):
+    """Serve the page, or a 304 if the client has the current version."""
+    if handler.headers.get('If-None-Match') == '"v1"':
+        return 304, {}, b''
+    return 200, {'ETag': '"v1"'}, PAGE
+
+
+class TestFetchApidocs(unittest.TestCase):
+    """Fetch the spec through a scratch cache dir."""
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        patcher = unittest.mock.patch.dict(
+            os.environ, {'MERAKYGEN_CACHE_DIR': self.cache_dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_conditional_get(self):
+        """The spec is downloaded once, then revalidated with its ETag."""
+        with MockMerakiServer(serve_apidocs) as server:
+            url = server.base_url + '/api_docs'
+            expected = [{'section': 'Admins', 'endpoints': []}]
+            self.assertEqual(web.fetch_meraki_apidocs_json(url), expected)
+            self.assertEqual(web.fetch_meraki_apidocs_json(url), expected)
+            self.assertEqual(len(server.requests), 1)
+            self.assertEqual(web.fetch_meraki_apidocs_json(url, 0), expected)
+            self.assertEqual(len(server.requests), 2)
+        spec_file = os.path.join(self.cache_dir, 'apidocs',
+                                 web.cache.get_hash(API_JSON) + '.json')
+        with open(spec_file, 'rb') as file_obj:
+            self.assertEqual(file_obj.read(), API_JSON)
+
+    def test_extract_across_chunks(self):
+        """Markers split between chunks are still found."""
+        chunks = [PAGE[i:i + 7] for i in range(0, len(PAGE), 7)]
+        self.assertEqual(web.extract_apidocs_json(iter(chunks)),
+                         API_JSON.decode())
+        with self.assertRaises(ValueError):
+            web.extract_apidocs_json([b'<html>Maintenance</html>'])
+
+    def test_fallbacks(self):
+        """Errors fall back to the last cached spec, then to static."""
+        with MockMerakiServer(serve_apidocs) as server:
+            url = server.base_url + '/api_docs'
+            web.fetch_meraki_apidocs_json(url)
+            server.responder = lambda _: (500, {}, b'')
+            self.assertEqual(web.fetch_meraki_apidocs_json(url, 0),
+                             [{'section': 'Admins', 'endpoints': []}])
+            static_json = web.get_json_str_from_file(web.STATIC_API_JSON)
+            self.assertEqual(
+                web.fetch_meraki_apidocs_json(url + '/missing'), static_json)
+
+    def test_write_atomic_permissions(self):
+        """Written files get 0o666 less the umask, like open() gives."""
+        filename = os.path.join(self.cache_dir, 'spec.json')
+        old_umask = os.umask(0o027)
+        try:
+            cache.write_atomic(filename, 'text')
+        finally:
+            os.umask(old_umask)
+        self.assertEqual(os.stat(filename).st_mode & 0o777, 0o640)
+        self.assertEqual(os.listdir(self.cache_dir), ['spec.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+# Compare Import-Module time of the two layouts of the generated module.
+#
+# Generate both layouts from one level below the repo, then run this there:
+#   merakygen --key $key --language powershell
+#   Rename-Item ps_merakygen ps_merakygen_files
+#   merakygen --key $key --language powershell --single-file
+#   pwsh ../tests/toy_scripts/powershell_import_time.ps1
+param(
+    [string]$FilesModule = "ps_merakygen_files",
+    [string]$SingleFileModule = "ps_merakygen",
+    [int]$Runs = 10
+)
+
+function Measure-Import([string]$moduleDir, [string]$rootModule) {
+    # Import in a new pwsh each run so that nothing is already loaded.
+    # The one-file-per-function entrypoint dot-sources from the current dir.
+    $times = foreach ($run in 1..$Runs) {
+        $command = "Set-Location '$moduleDir'; " +
+            "(Measure-Command { Import-Module ./$rootModule -Force }).TotalMilliseconds"
+        [double](pwsh -NoProfile -NonInteractive -Command $command 6>$null)
+    }
+    $sorted = $times | Sort-Object
+    return $sorted[[math]::Floor($sorted.Count / 2)]
+}
+
+function testImportTime() {
+    $filesMs = Measure-Import $FilesModule "MerakiAPI.psm1"
+    $singleFileMs = Measure-Import $SingleFileModule "$SingleFileModule.psm1"
+    Write-Information -InformationAction Continue ("One file per function: {0:N1}ms" -f $filesMs)
+    Write-Information -InformationAction Continue ("Single file:           {0:N1}ms" -f $singleFileMs)
+    Write-Information -InformationAction Continue ("Median of $Runs runs, {0:N1}x faster" -f ($filesMs / $singleFileMs))
+}
+
+testImportTime